@@ -27,6 +27,15 @@ CREATE TABLE grampanchayats (
     FOREIGN KEY (block_id) REFERENCES blocks(id)
 );
 
+-- Bumped whenever the reference tables above change so app caches reload
+CREATE TABLE IF NOT EXISTS reference_data_version (
+    id TINYINT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 1
+);
+
+INSERT INTO reference_data_version (id, version) VALUES (1, 1)
+    ON DUPLICATE KEY UPDATE version = version;
+
 CREATE TABLE IF NOT EXISTS vle_details (
     id INT AUTO_INCREMENT PRIMARY KEY,
     csc_id VARCHAR(12) NOT NULL,
@@ -70,6 +79,85 @@ CREATE TABLE IF NOT EXISTS vle_details (
     branch_name VARCHAR(50),
     
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE KEY (csc_id)
+    -- Bumped by every accepted update_record; clients send it back to detect stale edits
+    row_version INT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY (csc_id),
+    -- Identifiers are stored without spaces/dashes; search_record looks them up by equality
+    KEY idx_vle_aadhar_number (aadhar_number),
+    KEY idx_vle_contact_number (contact_number),
+    -- Lets the in-memory identifier index pick up recent writes incrementally
+    KEY idx_vle_updated_at (updated_at)
+);
+
+-- Confirmation emails queued in the same transaction as the vle_details insert
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    recipient VARCHAR(100) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'dead') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until DATETIME NULL,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    KEY idx_outbox_due (status, next_attempt_at)
+);
+
+-- Which grampanchayats each VLE covers (vle_details.grampanchayat/lgd_code keep the display text)
+CREATE TABLE IF NOT EXISTS vle_grampanchayats (
+    vle_id INT NOT NULL,
+    lgd_code INT NOT NULL,
+    -- Copied from the GP's ancestors so coverage by any level is one index range
+    block_id INT NOT NULL,
+    district_id INT NOT NULL,
+    division_id INT NOT NULL,
+    PRIMARY KEY (vle_id, lgd_code),
+    KEY idx_vle_gp_lgd_code (lgd_code, vle_id),
+    KEY idx_vle_gp_block (block_id, vle_id, lgd_code),
+    KEY idx_vle_gp_district (district_id, vle_id, lgd_code),
+    KEY idx_vle_gp_division (division_id, vle_id, lgd_code),
+    FOREIGN KEY (vle_id) REFERENCES vle_details(id) ON DELETE CASCADE
+);
+
+-- One row per accepted update_record: only the changed columns, as {column: [old, new]};
+-- Aadhar, PAN and account numbers are logged masked
+CREATE TABLE IF NOT EXISTS vle_change_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    vle_id INT NOT NULL,
+    row_version INT NOT NULL,
+    changes JSON NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_change_log_vle (vle_id, row_version),
+    FOREIGN KEY (vle_id) REFERENCES vle_details(id) ON DELETE CASCADE
+);
+
+-- submit_form results by client idempotency key, written in the submission's transaction
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key VARCHAR(64) PRIMARY KEY,
+    status_code SMALLINT NOT NULL,
+    response JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_idempotency_created (created_at)
+);
+
+-- VLE counts per geography node, kept current by submit_form/update_record;
+-- `flask rebuild-counters` recomputes them from vle_grampanchayats
+CREATE TABLE IF NOT EXISTS geo_counters (
+    level ENUM('gp', 'block', 'district', 'division') NOT NULL,
+    node_id INT NOT NULL,
+    individual_vles INT NOT NULL DEFAULT 0,
+    cluster_vles INT NOT NULL DEFAULT 0,
+    gps_covered INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (level, node_id)
 );
 
+-- New VLEs per geography node and enrollment day (same maintenance as geo_counters)
+CREATE TABLE IF NOT EXISTS geo_daily_enrollments (
+    level ENUM('gp', 'block', 'district', 'division') NOT NULL,
+    node_id INT NOT NULL,
+    day DATE NOT NULL,
+    enrollments INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (level, node_id, day)
+);
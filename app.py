@@ -1,242 +1,293 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, make_response, Response, stream_with_context, g
 import os
+import json
+import re
 import mysql.connector
 from dotenv import load_dotenv
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
+from functools import wraps
+import click
+import hmac
+import logging
+import time
+import uuid
+from db import get_db_connection, pool_stats
+import geo_cache
+from assignments import assignment_rows, write_assignments
+from validation import normalize_identifier, record_from_form, record_from_json, validate_record
+import outbox
+import mailer
+import email_render
+import vle_import
+import vle_export
+import idempotency
+import identifier_index
+import name_search
+from ttl_cache import TTLCache
+from vle_sync import VleSync
+import metrics
+import structured_log
+import geo_loader
+import geo_counters
 
 
 load_dotenv()
+structured_log.configure()
+log = logging.getLogger('app')
 port = int(os.environ.get("PORT", 5000))
 app = Flask(__name__)
 
-# Database connection
-def get_db_connection():
-    connection = mysql.connector.connect(
-        host=os.getenv('DB_HOST'),
-        port=os.getenv('DB_PORT'),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        database=os.getenv('DB_NAME'),
-        charset='utf8mb4'
-    )
-    return connection
+
+def require_admin_token(view):
+    """Allow the request only when X-Admin-Token matches the ADMIN_TOKEN setting"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv('ADMIN_TOKEN')
+        if not expected or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected):
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def warm_caches():
+    """Load in-memory reference data once at startup instead of on the first request"""
+    try:
+        geo_cache.load()
+    except Exception:
+        log.exception("Error warming geography cache")
+    try:
+        identifier_index.load()
+    except Exception:
+        log.exception("Error warming identifier index")
+    try:
+        name_search.load()
+    except Exception:
+        log.exception("Error warming name search index")
+
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    try:
+        geo_version = geo_cache.get().bundle()['etag']
+    except Exception:
+        log.exception("Error loading geography for index")
+        geo_version = ''
+    return render_template('index.html', geo_version=geo_version)
 
 @app.route('/get_divisions', methods=['GET'])
 def get_divisions():
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT id, name FROM divisions")
-        divisions = cursor.fetchall()
-        print("Fetched divisions:", divisions)
-        return jsonify(divisions)
+        return jsonify(geo_cache.get().divisions)
     except Exception as e:
-        print("Error in get_divisions:", str(e))  # Logs to Render console
+        log.exception("Error in get_divisions")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'connection' in locals(): connection.close()
 
 @app.route('/get_districts/<division_id>', methods=['GET'])
 def get_districts(division_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=False)
-    cursor.execute("SELECT * FROM districts WHERE division_id = %s", (division_id,))
-    districts = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return jsonify(districts)
+    return jsonify(geo_cache.get().districts_of(division_id))
 
 @app.route('/get_blocks/<district_id>', methods=['GET'])
 def get_blocks(district_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=False)
-    cursor.execute("SELECT * FROM blocks WHERE district_id = %s", (district_id,))
-    blocks = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return jsonify(blocks)
+    return jsonify(geo_cache.get().blocks_of(district_id))
 
 @app.route('/get_grampanchayats/<block_id>', methods=['GET'])
 def get_grampanchayats(block_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=False)
-    cursor.execute("SELECT * FROM grampanchayats WHERE block_id = %s", (block_id,))
-    grampanchayats = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return jsonify(grampanchayats)
-
-def validate_pincode(pincode):
-    """Validate that pincode is exactly 6 digits"""
-    return pincode and pincode.isdigit() and len(pincode) == 6
+    return jsonify(geo_cache.get().grampanchayats_of(block_id))
+
+@app.route('/search_grampanchayats', methods=['GET'])
+def search_grampanchayats():
+    """Typeahead over every GP in the state (?q=, ?limit=); each match carries its
+    block, district and division so the form can fill the whole cascade"""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(geo_cache.get().search_grampanchayats(request.args.get('q', ''), limit))
+
+@app.route('/geography_bundle', methods=['GET'])
+def geography_bundle():
+    """Full division/district/block/GP hierarchy in one response.
+
+    Optional ?division=<id> limits it to one division. Clients pass the
+    content hash as ?v=... (index.html does), which makes the URL safe to
+    cache for a year; without it the response must be revalidated via ETag.
+    """
+    division_id = request.args.get('division', type=int)
+    snapshot = geo_cache.get()
+    # Bundles are cached per division, so only real ids may create one
+    if division_id is not None and division_id not in snapshot.division_by_id:
+        return jsonify({'success': False, 'message': 'Division not found'}), 404
+    bundle = snapshot.bundle(division_id)
+    etag = bundle['etag']
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = 'identity'
+    if 'br' in bundle and 'br' in accepted:
+        encoding = 'br'
+    elif 'gzip' in accepted:
+        encoding = 'gzip'
+
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(bundle[encoding])
+        response.headers['Content-Type'] = 'application/json'
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if request.args.get('v') == etag:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+@app.route('/admin/reload_geography', methods=['POST'])
+@require_admin_token
+def reload_geography():
+    snapshot = geo_cache.reload()
+    return jsonify({'success': True, 'version': snapshot.version, 'counts': snapshot.counts()})
+
+@app.cli.command('reload-geography')
+def reload_geography_command():
+    """Bump the reference data version so every app process reloads its geography cache"""
+    snapshot = geo_cache.reload()
+    print(f"Geography version {snapshot.version}: {snapshot.counts()}")
+
+@app.cli.command('load-geography')
+@click.option('--dir', 'directory', type=click.Path(exists=True, file_okay=False),
+              default=os.path.dirname(os.path.abspath(__file__)), show_default=True,
+              help='folder holding Divisions.csv, Districts.csv, Blocks.csv and GP.csv')
+@click.option('--dry-run', is_flag=True, help='only print what would change')
+def load_geography_command(directory, dry_run):
+    """Sync the geography tables with the reference CSVs, applying only the differences"""
+    try:
+        geo_loader.load(directory, dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+# Each identifier is matched through its own index; csc_id wins over aadhar over mobile
+SEARCH_RECORD_QUERY = """
+    SELECT v.*,
+            DATE_FORMAT(v.dob, '%Y-%m-%d') as dob_formatted,
+            DATE_FORMAT(v.anniversary_date, '%Y-%m-%d') as anniversary_date_formatted
+    FROM vle_details v
+    JOIN (
+        SELECT id, 1 AS priority FROM vle_details WHERE csc_id = %(term)s
+        UNION ALL
+        SELECT id, 2 AS priority FROM vle_details WHERE aadhar_number = %(term)s
+        UNION ALL
+        SELECT id, 3 AS priority FROM vle_details WHERE contact_number = %(term)s
+        ORDER BY priority
+        LIMIT 1
+    ) m ON m.id = v.id
+"""
+
+def build_vle_data(form_data, location):
+    """vle_details column values for a validated form submission (see validation.validate_record)"""
+    # Process addresses
+    perm_address = ", ".join(filter(None, [
+        form_data['permAddressLine1'],
+        form_data.get('permAddressLine2'),
+        f"{form_data['permCity']} - {form_data['permPincode']}"
+    ]))
+    
+    same_current_address = 'sameCurrentAddress' in form_data
+    if same_current_address:
+        curr_address = perm_address
+    else:
+        curr_address = ", ".join(filter(None, [
+            form_data.get('currAddressLine1', ''),
+            form_data.get('currAddressLine2', ''),
+            f"{form_data.get('currCity', '')} - {form_data.get('currPincode', '')}" 
+            if form_data.get('currCity') else None
+        ])) or None
+
+    # Handle checkbox values
+    same_whatsapp = 'sameWhatsapp' in form_data
+    
+    return {
+        'vle_type': form_data['employeeType'],
+        'csc_id': normalize_identifier(form_data['cscId']),
+        'division': location['division'],
+        'district': location['district'],
+        'block': location['block'],
+        'grampanchayat': ', '.join(location['grampanchayat_names']),
+        'lgd_code': ', '.join(location['lgd_codes']),
+        
+        # Personal Details
+        'first_name': form_data['firstName'],
+        'father_name': form_data['fatherName'],
+        'mother_name': form_data['motherName'],
+        'surname': form_data['surname'],
+        'dob': form_data['dob'],
+        'blood_group': form_data.get('blood_group', ''),
+        'gender': form_data['gender'],
+        'marital_status': form_data['maritalStatus'],
+        'spouse_name': form_data.get('spouseName', ''),
+        'num_children': int(form_data.get('numChildren', 0)) if form_data.get('numChildren') else None,
+        'anniversary_date': form_data.get('anniversary_date') or None,
+        'religion': form_data['religion'] if form_data['religion'] != 'Other' else form_data.get('otherReligion', ''),
+        'category': form_data['category'] if form_data['category'] != 'Other' else form_data.get('otherCategory', ''),
+        'caste': form_data.get('caste', ''),
+        'education': form_data['education'] if form_data['education'] != 'Other' else form_data.get('otherEducation', ''),
+        'institute_name': form_data['instituteName'],
+        'cibil_score': int(form_data['cibilScore']),
+
+        # Contact Details
+        'contact_number': normalize_identifier(form_data['contactNumber']),
+        'whatsapp_number': normalize_identifier(form_data['contactNumber'] if same_whatsapp else form_data.get('whatsappNumber', '')),
+        'email': form_data['email'],
+        
+        # Address Details
+        'permanent_address': perm_address,
+        'current_address': curr_address,
+        
+        # Identification Details
+        'pan_number': form_data.get('panNumber', ''),
+        'aadhar_number': normalize_identifier(form_data.get('aadharNumber', '')),
+        
+        # Bank Details
+        'bank_name': form_data.get('bankName', '') if form_data.get('bankName') != 'Other' else form_data.get('otherBank', ''),
+        'ifsc_code': form_data.get('ifsc', ''),
+        'account_number': form_data.get('accountNumber', ''),
+        'branch_name': form_data.get('branchName', '')
+    }
+
+def replayed_response(replay):
+    status_code, body = replay
+    response = jsonify(body)
+    response.status_code = status_code
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
 
 @app.route('/submit_form', methods=['POST'])
 def submit_form():
     try:
         form_data = request.form
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get employee type
-        vle_type = form_data['employeeType']
-        
-        # Get selected grampanchayats
-        if vle_type == 'cluster':
-            grampanchayat_ids = request.form.getlist('grampanchayat')
-        else:
-            gp = form_data.get('grampanchayat')
-            grampanchayat_ids = [gp] if gp else []
 
-        
-        # Validate grampanchayat selection
-        if vle_type == 'cluster' and len(grampanchayat_ids) < 2:
-            return jsonify({
-                'success': False,
-                'message': 'Please select at least 2 grampanchayats for cluster type'
-            }), 400
-        elif vle_type == 'individual' and len(grampanchayat_ids) != 1:
-            return jsonify({
-                'success': False,
-                'message': 'Please select exactly 1 grampanchayat for individual type'
-            }), 400
+        # Retries and double-clicks carry the same key and get the first response back
+        idempotency_key = form_data.get('idempotencyKey', '')
+        if idempotency_key:
+            if not idempotency.valid_key(idempotency_key):
+                return jsonify({'success': False, 'message': 'Invalid idempotency key'}), 400
+            replay = idempotency.lookup(idempotency_key)
+            if replay:
+                return replayed_response(replay)
 
-        # Validate pincodes
-        if not validate_pincode(form_data['permPincode']):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid permanent address pincode (must be 6 digits)'
-            }), 400
-            
-        if (not form_data.get('sameCurrentAddress') and 
-            form_data.get('currPincode') and 
-            not validate_pincode(form_data['currPincode'])):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid current address pincode (must be 6 digits)'
-            }), 400
+        errors, location = validate_record(record_from_form(form_data), geo_cache.get(), first_only=True)
+        if errors:
+            return jsonify({'success': False, 'message': errors[0]['message']}), 400
 
-        # Validate CIBIL score
-        cibil_score = form_data.get('cibilScore', '')
-        if not cibil_score.isdigit() or not (300 <= int(cibil_score) <= 900):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid CIBIL score (must be 300-900)'
-            }), 400
-
-        # Process addresses
-        perm_address = ", ".join(filter(None, [
-            form_data['permAddressLine1'],
-            form_data.get('permAddressLine2'),
-            f"{form_data['permCity']} - {form_data['permPincode']}"
-        ]))
-        
-        same_current_address = 'sameCurrentAddress' in form_data
-        if same_current_address:
-            curr_address = perm_address
-        else:
-            curr_address = ", ".join(filter(None, [
-                form_data.get('currAddressLine1', ''),
-                form_data.get('currAddressLine2', ''),
-                f"{form_data.get('currCity', '')} - {form_data.get('currPincode', '')}" 
-                if form_data.get('currCity') else None
-            ])) or None
-
-        # Get grampanchayat details
-        cursor.execute("SELECT LGD_Code, name FROM grampanchayats WHERE LGD_Code IN (%s)" % 
-                      ','.join(['%s']*len(grampanchayat_ids)), grampanchayat_ids)
-        gp_results = cursor.fetchall()
-        
-        if len(gp_results) != len(grampanchayat_ids):
-            return jsonify({
-                'success': False,
-                'message': 'One or more selected grampanchayats not found'
-            }), 400
-        
-        grampanchayat_names = [gp['name'] for gp in gp_results]
-        lgd_codes = [str(gp['LGD_Code']) for gp in gp_results]
-
-        # Get division name
-        cursor.execute("SELECT name FROM divisions WHERE id = %s", (form_data['division'],))
-        division_result = cursor.fetchone()
-        if not division_result:
-            return jsonify({'success': False, 'message': 'Division not found'}), 400
-        division_name = division_result['name']
-        
-        # Get district name
-        cursor.execute("SELECT name FROM districts WHERE id = %s", (form_data['district'],))
-        district_result = cursor.fetchone()
-        if not district_result:
-            return jsonify({'success': False, 'message': 'District not found'}), 400
-        district_name = district_result['name']
-        
-        # Get block name
-        cursor.execute("SELECT name FROM blocks WHERE id = %s", (form_data['block'],))
-        block_result = cursor.fetchone()
-        if not block_result:
-            return jsonify({'success': False, 'message': 'Block not found'}), 400
-        block_name = block_result['name']
-
-        # Handle checkbox values
-        same_whatsapp = 'sameWhatsapp' in form_data
-        
-        # Prepare data for database
-        data = {
-            'vle_type': vle_type,
-            'csc_id': form_data['cscId'],
-            'division': division_name,
-            'district': district_name,
-            'block': block_name,
-            'grampanchayat': ', '.join(grampanchayat_names),
-            'lgd_code': ', '.join(lgd_codes),
-            
-            # Personal Details
-            'first_name': form_data['firstName'],
-            'father_name': form_data['fatherName'],
-            'mother_name': form_data['motherName'],
-            'surname': form_data['surname'],
-            'dob': form_data['dob'],
-            'blood_group': form_data.get('blood_group', ''),
-            'gender': form_data['gender'],
-            'marital_status': form_data['maritalStatus'],
-            'spouse_name': form_data.get('spouseName', ''),
-            'num_children': int(form_data.get('numChildren', 0)) if form_data.get('numChildren') else None,
-            'anniversary_date': form_data.get('anniversary_date') or None,
-            'religion': form_data['religion'] if form_data['religion'] != 'Other' else form_data.get('otherReligion', ''),
-            'category': form_data['category'] if form_data['category'] != 'Other' else form_data.get('otherCategory', ''),
-            'caste': form_data.get('caste', ''),
-            'education': form_data['education'] if form_data['education'] != 'Other' else form_data.get('otherEducation', ''),
-            'institute_name': form_data['instituteName'],
-            'cibil_score': int(cibil_score),
-
-            # Contact Details
-            'contact_number': form_data['contactNumber'],
-            'whatsapp_number': form_data['contactNumber'] if same_whatsapp else form_data.get('whatsappNumber', ''),
-            'email': form_data['email'],
-            
-            # Address Details
-            'permanent_address': perm_address,
-            'current_address': curr_address,
-            
-            # Identification Details
-            'pan_number': form_data.get('panNumber', ''),
-            'aadhar_number': form_data.get('aadharNumber', ''),
-            
-            # Bank Details
-            'bank_name': form_data['bankName'] if form_data.get('bankName') != 'Other' else form_data.get('otherBank', ''),
-            'ifsc_code': form_data.get('ifsc', ''),
-            'account_number': form_data.get('accountNumber', ''),
-            'branch_name': form_data.get('branchName', '')
-        }
+        data = build_vle_data(form_data, location)
 
         # Insert data
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        result = {'success': True, 'message': 'Form submitted successfully!'}
+        if idempotency_key:
+            idempotency.claim(cursor, idempotency_key, 200, result)
+
         query = """
         INSERT INTO vle_details (
             vle_type, csc_id, division, district, block, grampanchayat, lgd_code,
@@ -256,207 +307,244 @@ def submit_form():
         """
         
         cursor.execute(query, data)
-        connection.commit()
+        vle_id = cursor.lastrowid
+        write_assignments(cursor, vle_id, location['lgd_codes'])
+        geo_counters.apply(cursor, None, (data['vle_type'], location['lgd_codes']))
 
-        # Send confirmation email
-        send_confirmation_email(data['email'], data)
+        # Queue the confirmation email in the same transaction; outbox workers send it.
+        # The queued copy only holds the masked identifiers the email shows.
+        outbox.enqueue(cursor, data['email'], email_render.mask_identifiers(data))
+        connection.commit()
+        outbox.wake()
+        identifier_index.add(data)
+        name_search.upsert(vle_id, data)
+        if idempotency_key:
+            idempotency.completed(idempotency_key, 200, result)
 
-        
-        return jsonify({'success': True, 'message': 'Form submitted successfully!'})
+        return jsonify(result)
     
+    except idempotency.KeyInUse:
+        # A concurrent request with this key committed first
+        connection.rollback()
+        replay = idempotency.lookup(idempotency_key)
+        if replay:
+            return replayed_response(replay)
+        return jsonify({'success': False, 'message': 'This submission is already being processed'}), 409
+    except mysql.connector.IntegrityError as err:
+        if err.errno == 1062:
+            return jsonify({
+                'success': False,
+                'message': 'A record with this CSC ID already exists. Search for it to update it instead.'
+            }), 409
+        return jsonify({'success': False, 'message': f'Database error: {str(err)}'}), 500
     except mysql.connector.Error as err:
+        log.exception("Database error in submit_form")
         return jsonify({'success': False, 'message': f'Database error: {str(err)}'}), 500
     except Exception as e:
+        log.exception("Error in submit_form")
         return jsonify({'success': False, 'message': f'An error occurred: {str(e)}'}), 500
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'connection' in locals(): connection.close()
 
 def send_confirmation_email(recipient_email, form_data):
-    try:
-        # Mask sensitive information
-        def mask_aadhar(aadhar):
-            return f"**** **** {aadhar[-4:]}" if aadhar and len(aadhar) >= 4 else 'Not provided'
-        
-        def mask_pan(pan):
-            return f"{pan[:2]}*****{pan[-2:]}" if pan and len(pan) >= 4 else 'Not provided'
-        
-        def mask_account(account):
-            return f"****{account[-4:]}" if account and len(account) >= 4 else 'Not provided'
-
-        # Prepare email data with masked values
-        email_data = {
-            **form_data,
-            'aadhar_number': mask_aadhar(form_data.get('aadhar_number')),
-            'pan_number': mask_pan(form_data.get('pan_number')),
-            'account_number': mask_account(form_data.get('account_number')),
-            # Format dates properly
-            'dob': form_data.get('dob', 'Not provided'),
-            'anniversary_date': form_data.get('anniversary_date', 'Not provided')
-        }
-
-        # Create message container
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = os.getenv('EMAIL_SUBJECT', 'Employee Details Submission Confirmation')
-        msg['From'] = os.getenv('EMAIL_FROM')
-        msg['To'] = recipient_email
-        msg['Date'] = formatdate(localtime=True)
-        
-        # Add admin as BCC if configured
-        if os.getenv('EMAIL_ADMIN'):
-            msg['Bcc'] = os.getenv('EMAIL_ADMIN')
-
-        from datetime import datetime
-        email_data['submitted_year'] = datetime.now().year
-        # Render HTML template
-        html_content = render_template('email_confirmation.html', **email_data)
-        
-        # Create plain text version
-        text_content = f"""VLE Details Submission Confirmation
-
-        Dear {form_data['first_name']} {form_data['surname']},
-        
-        Thank you for submitting your details. Here is the information you provided:
-        
-        BASIC INFORMATION:
-        - VLE Type: {form_data['vle_type']}
-        - CSC ID: {form_data['csc_id']}
-        - Full Name: {form_data['first_name']} {form_data['surname']}
-        - Father's Name: {form_data['father_name']}
-        - Mother's Name: {form_data['mother_name']}
-        - Date of Birth: {form_data.get('dob', 'Not provided')}
-        
-        PERSONAL DETAILS:
-        - Gender: {form_data['gender']}
-        - Marital Status: {form_data['marital_status']}
-        - Spouse Name: {form_data.get('spouse_name', 'N/A')}
-        - Number of Children: {form_data.get('num_children', '0')}
-        - Blood Group: {form_data.get('blood_group', 'N/A')}
-        
-        CONTACT INFORMATION:
-        - Mobile Number: {form_data['contact_number']}
-        - WhatsApp Number: {form_data['whatsapp_number']}
-        - Email Address: {form_data['email']}
-        
-        ADDRESS DETAILS:
-        - Permanent Address: {form_data['permanent_address']}
-        - Current Address: {form_data.get('current_address', 'Same as permanent address')}
-        
-        IDENTIFICATION DETAILS:
-        - PAN Number: {mask_pan(form_data.get('pan_number'))}
-        - Aadhar Number: {mask_aadhar(form_data.get('aadhar_number'))}
-        
-        BANK DETAILS:
-        - Bank Name: {form_data['bank_name']}
-        - Account Number: {mask_account(form_data.get('account_number'))}
-        - IFSC Code: {form_data.get('ifsc_code', 'Not provided')}
-        - Branch Name: {form_data.get('branch_name', 'Not provided')}
-        
-        LOCATION DETAILS:
-        - Division: {form_data['division']}
-        - District: {form_data['district']}
-        - Block: {form_data['block']}
-        - Grampanchayat: {form_data['grampanchayat']}
-        - LGD Code: {form_data['lgd_code']}
-        
-        This is an automated confirmation. Please do not reply to this email.
-        If you need to make any corrections you can search your record with the help of your Mobile number, CSC ID or Aadhar number, 
-        If you face any issue please contact the administrator +91 7410009796.
-        """
+    """Render and send the confirmation email; raises on failure so the outbox can retry"""
+    # Render both bodies from the precompiled templates (see email_render.py)
+    with metrics.timed(metrics.EMAIL_RENDER_SECONDS):
+        text_content, html_content = email_render.render_confirmation(form_data)
+
+    # Create message container
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = os.getenv('EMAIL_SUBJECT', 'Employee Details Submission Confirmation')
+    msg['From'] = os.getenv('EMAIL_FROM')
+    msg['To'] = recipient_email
+    msg['Date'] = formatdate(localtime=True)
+    
+    # Add admin as BCC if configured
+    if os.getenv('EMAIL_ADMIN'):
+        msg['Bcc'] = os.getenv('EMAIL_ADMIN')
 
-        # Attach both versions
-        msg.attach(MIMEText(text_content, 'plain'))
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        # Send email
-        with smtplib.SMTP(os.getenv('SMTP_SERVER'), int(os.getenv('SMTP_PORT', 587))) as server:
-            server.starttls()
-            server.login(os.getenv('SMTP_USERNAME'), os.getenv('SMTP_PASSWORD'))
-            recipients = [recipient_email]
-            if os.getenv('EMAIL_ADMIN'):
-                recipients.append(os.getenv('EMAIL_ADMIN'))
-            server.sendmail(os.getenv('EMAIL_FROM'), recipients, msg.as_string())
-        
-        return True
+    # Attach both versions
+    msg.attach(MIMEText(text_content, 'plain'))
+    msg.attach(MIMEText(html_content, 'html'))
+    
+    # Send email over a reused, already authenticated session (see mailer.py)
+    recipients = [recipient_email]
+    if os.getenv('EMAIL_ADMIN'):
+        recipients.append(os.getenv('EMAIL_ADMIN'))
+    try:
+        with metrics.timed(metrics.EMAIL_SEND_SECONDS):
+            mailer.get_relay().send(os.getenv('EMAIL_FROM'), recipients, msg.as_string())
+    except Exception:
+        metrics.EMAIL_SEND_FAILURES.inc()
+        raise
+
+    return True
+
+
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+@app.before_request
+def start_request_metrics():
+    metrics.begin_request()
+    g.request_started = time.perf_counter()
+    # Keep an upstream proxy's id so log lines can be joined across hops
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID_PATTERN.fullmatch(request_id) else uuid.uuid4().hex[:16]
+    structured_log.set_request_context(g.request_id, request.endpoint or 'unmatched')
+
+@app.after_request
+def note_response_status(response):
+    g.response_status = response.status_code
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs after the response is built (even on unhandled errors); cheap enough to keep on
+    status = 500 if exc is not None else g.get('response_status', 500)
+    route = request.endpoint or 'unmatched'
+    queries, db_seconds = metrics.current_request()
+    metrics.end_request(route, request.method, status)
+    if 'request_started' in g:
+        structured_log.log_request(
+            log, request.method, route, status, (time.perf_counter() - g.request_started) * 1000,
+            path=request.path, queries=queries, db_ms=round(db_seconds * 1000, 1))
+    structured_log.clear_request_context()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_background_workers():
+    # Started lazily (and per process) so CLI commands and the gunicorn master don't send mail
+    outbox.start_workers(send_confirmation_email)
+
+
+@app.cli.command('drain-outbox')
+def drain_outbox_command():
+    """Deliver queued confirmation emails in the foreground (e.g. with OUTBOX_WORKERS=0 in web)"""
+    outbox.run_forever(send_confirmation_email)
+
+def describe_location(vle_type, lgd_codes):
+    """Build search_record's location_ids / grampanchayat_details from assigned LGD codes"""
+    snapshot = geo_cache.get()
+    gps = [snapshot.gp_by_code[code] for code in lgd_codes if code in snapshot.gp_by_code]
+    details = []
+    for code, name, block_id in gps:
+        district_id = snapshot.block_by_id[block_id][2]
+        details.append({
+            'LGD_Code': code,
+            'name': name,
+            'block_id': block_id,
+            'district_id': district_id,
+            'division_id': snapshot.district_by_id[district_id][2],
+        })
+
+    if vle_type == 'individual' and len(details) == 1:
+        gp = details[0]
+        return {
+            'division_id': gp['division_id'],
+            'district_id': gp['district_id'],
+            'block_id': gp['block_id'],
+            'grampanchayat_id': str(gp['LGD_Code'])
+        }, []
+
+    if vle_type == 'cluster' and len(details) > 1:
+        # Verify all GPs are from same block
+        if len(set(gp['block_id'] for gp in details)) == 1:
+            gp = details[0]
+            return {
+                'division_id': gp['division_id'],
+                'district_id': gp['district_id'],
+                'block_id': gp['block_id'],
+                'grampanchayat_ids': [gp['LGD_Code'] for gp in details]
+            }, details
+        return {}, details
+
+    return {}, []
+
+# ?field= names accepted by /check_identifier, mapped to vle_details columns
+CHECK_IDENTIFIER_FIELDS = {
+    'cscId': 'csc_id',
+    'aadharNumber': 'aadhar_number',
+    'contactNumber': 'contact_number',
+}
+
+@app.route('/check_identifier', methods=['GET'])
+def check_identifier():
+    """Is this CSC ID / Aadhar / mobile number already registered? (?field=&value=)
+
+    When editing, pass the record's own CSC ID as ?exclude= so it isn't
+    reported as a duplicate of itself.
+    """
+    column = CHECK_IDENTIFIER_FIELDS.get(request.args.get('field'))
+    if column is None:
+        return jsonify({'success': False, 'message': 'field must be cscId, aadharNumber or contactNumber'}), 400
+    value = normalize_identifier(request.args.get('value'))
+    if not value:
+        return jsonify({'success': False, 'message': 'value is required'}), 400
+    exclude = normalize_identifier(request.args.get('exclude')) or None
+    try:
+        registered = identifier_index.is_registered(column, value, exclude)
     except Exception as e:
-        print(f"Error sending confirmation email: {str(e)}")
-        return False
+        log.exception("Error in check_identifier")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({'success': True, 'registered': registered})
+
+# search_record responses: normalized term -> record id -> response body.
+# update_record drops the record's entry here; entries for records other
+# processes saved are dropped by search_cache_sync within SEARCH_CACHE_SYNC_SECONDS.
+search_terms = TTLCache(int(os.getenv('SEARCH_CACHE_SIZE', 2000)), float(os.getenv('SEARCH_CACHE_TTL', 30)))
+search_results = TTLCache(int(os.getenv('SEARCH_CACHE_SIZE', 2000)), float(os.getenv('SEARCH_CACHE_TTL', 30)))
+
+def drop_changed_records(rows):
+    """Drop cached records whose row_version changed in MySQL (vle_sync rows: id, row_version)"""
+    for record_id, row_version, _ in rows:
+        cached = search_results.peek(record_id)
+        if cached is not None and cached['record']['row_version'] != row_version:
+            search_results.pop(record_id)
+
+# One indexed updated_at range read per SEARCH_CACHE_SYNC_SECONDS per process
+# replaces a row_version read on every hit; the cache starts empty, so there
+# is nothing to backfill
+search_cache_sync = VleSync('search cache', ('id', 'row_version'), drop_changed_records,
+                            'SEARCH_CACHE_SYNC_SECONDS', 2, backfill=False)
 
 @app.route('/search_record', methods=['GET'])
 def search_record():
     try:
-        search_term = request.args.get('term')
+        search_term = normalize_identifier(request.args.get('term'))
         if not search_term:
             return jsonify({'success': False, 'message': 'Search term is required'})
-            
+
+        # A hit needs no connection; records saved by other processes were
+        # dropped by the last sync
+        search_cache_sync.sync()
+        record_id = search_terms.get(search_term)
+        if record_id is not None:
+            cached = search_results.get(record_id)
+            if cached is not None:
+                return jsonify(cached)
+
         connection = get_db_connection()
         cursor = connection.cursor(dictionary=True)
         
-        # First try exact matches
-        cursor.execute("""
-            SELECT v.*, 
-                    DATE_FORMAT(v.dob, '%Y-%m-%d') as dob_formatted,
-                    DATE_FORMAT(v.anniversary_date, '%Y-%m-%d') as anniversary_date_formatted
-            FROM vle_details v
-            WHERE trim(v.csc_id) = %s 
-               OR trim(v.aadhar_number) = %s 
-               OR trim(v.contact_number) = %s
-            LIMIT 1
-        """, (search_term, search_term, search_term))
+        # Exact match on any identifier (stored normalized, so plain indexed equality)
+        cursor.execute(SEARCH_RECORD_QUERY, {'term': search_term})
         
         record = cursor.fetchone()
         
         if not record:
             return jsonify({'success': False, 'message': 'Record not found'})
         
-        # Get location information
-        location_ids = {}
-        grampanchayat_details = []
-        lgd_codes = record['lgd_code'].split(', ') if record['lgd_code'] else []
-        
-        if lgd_codes:
-            if record['vle_type'] == 'individual' and len(lgd_codes) == 1:
-                # For individual, get single GP location
-                cursor.execute("""
-                    SELECT g.LGD_Code, g.block_id, b.district_id, d.division_id as division_id
-                    FROM grampanchayats g
-                    JOIN blocks b ON g.block_id = b.id
-                    JOIN districts d ON b.district_id = d.id
-                    WHERE g.LGD_Code = %s
-                """, (lgd_codes[0],))
-                gp_location = cursor.fetchone()
-                
-                if gp_location:
-                    location_ids = {
-                        'division_id': gp_location['division_id'],
-                        'district_id': gp_location['district_id'],
-                        'block_id': gp_location['block_id'],
-                        'grampanchayat_id': lgd_codes[0]
-                    }
-            
-            elif record['vle_type'] == 'cluster' and len(lgd_codes) > 1:
-                # For cluster, get all GP details
-                cursor.execute("""
-                    SELECT g.LGD_Code, g.name, g.block_id, 
-                           b.district_id, d.division_id as division_id
-                    FROM grampanchayats g
-                    JOIN blocks b ON g.block_id = b.id
-                    JOIN districts d ON b.district_id = d.id
-                    WHERE g.LGD_Code IN (%s)
-                """ % ','.join(['%s']*len(lgd_codes)), lgd_codes)
-                grampanchayat_details = cursor.fetchall()
-                
-                if grampanchayat_details:
-                    # Verify all GPs are from same block
-                    block_ids = set(gp['block_id'] for gp in grampanchayat_details)
-                    if len(block_ids) == 1:
-                        gp = grampanchayat_details[0]
-                        location_ids = {
-                            'division_id': gp['division_id'],
-                            'district_id': gp['district_id'],
-                            'block_id': gp['block_id'],
-                            'grampanchayat_ids': [gp['LGD_Code'] for gp in grampanchayat_details]
-                        }
+        # Assigned GPs come from the assignment table, their hierarchy from the geography cache
+        cursor.execute(
+            "SELECT lgd_code FROM vle_grampanchayats WHERE vle_id = %s ORDER BY lgd_code",
+            (record['id'],))
+        lgd_codes = [row['lgd_code'] for row in cursor.fetchall()]
+        location_ids, grampanchayat_details = describe_location(record['vle_type'], lgd_codes)
 
         response = {
             'success': True, 
@@ -464,209 +552,436 @@ def search_record():
             'location_ids': location_ids,
             'grampanchayat_details': grampanchayat_details
         }
+        search_terms.set(search_term, record['id'])
+        search_results.set(record['id'], response)
         
         return jsonify(response)
     
     except Exception as e:
+        log.exception("Error in search_record")
         return jsonify({'success': False, 'message': str(e)}), 500
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'connection' in locals(): connection.close()
 
-@app.route('/update_record', methods=['POST'])
-def update_record():
+@app.route('/search_vles', methods=['GET'])
+@require_admin_token
+def search_vles():
+    """Fuzzy search by partial name, father's name, surname, mobile or CSC ID (?q=, ?limit=).
+
+    Served from the in-memory trigram index (see name_search.py); results
+    are ranked by the share of the query's trigrams they contain.
+    """
+    query = request.args.get('q', '')
+    # Trigrams never span words, so "ab cd" is as unsearchable as "ab"
+    if not name_search.trigrams(name_search.normalize(query)):
+        return jsonify({'success': False, 'message': 'Enter a word of at least 3 letters or digits'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    try:
+        results = name_search.search(query, limit)
+    except Exception as e:
+        log.exception("Error in search_vles")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({'success': True, 'results': results})
+
+COVERAGE_COLUMNS = {
+    'gp': 'lgd_code',
+    'block': 'block_id',
+    'district': 'district_id',
+    'division': 'division_id',
+}
+
+@app.route('/coverage/<level>/<int:node_id>', methods=['GET'])
+@require_admin_token
+def coverage(level, node_id):
+    """VLEs covering a GP, block, district or division, keyset-paginated by VLE id.
+
+    Pass the returned next_after as ?after= to get the next page; counts are
+    only included with the first page (they are null on later pages).
+    """
+    column = COVERAGE_COLUMNS.get(level)
+    if column is None:
+        return jsonify({'success': False, 'message': 'Level must be gp, block, district or division'}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    after = request.args.get('after', 0, type=int)
+
     try:
-        form_data = request.form
-        csc_id = form_data['cscId']
         connection = get_db_connection()
         cursor = connection.cursor(dictionary=True)
-        
-        # Get employee type
-        vle_type = form_data['employeeType']
-        
-        # Get selected grampanchayats
-        grampanchayat_ids = request.form.getlist('grampanchayat') if vle_type == 'cluster' else [form_data['grampanchayat']]
-        
-        # Validate grampanchayat selection
-        if vle_type == 'cluster' and len(grampanchayat_ids) < 2:
-            return jsonify({
-                'success': False,
-                'message': 'Please select at least 2 grampanchayats for cluster type'
-            }), 400
-        elif vle_type == 'individual' and len(grampanchayat_ids) != 1:
-            return jsonify({
-                'success': False,
-                'message': 'Please select exactly 1 grampanchayat for individual type'
-            }), 400
+        # A range read on the (column, vle_id, ...) index of the assignment table
+        cursor.execute(f"""
+            SELECT v.id, v.csc_id, v.vle_type, v.first_name, v.surname, v.contact_number,
+                   v.email, v.block, v.grampanchayat, v.lgd_code
+            FROM (
+                SELECT DISTINCT vle_id FROM vle_grampanchayats
+                WHERE {column} = %s AND vle_id > %s
+                ORDER BY vle_id
+                LIMIT %s
+            ) a
+            JOIN vle_details v ON v.id = a.vle_id
+            ORDER BY v.id
+        """, (node_id, after, limit))
+        vles = cursor.fetchall()
+
+        # Totals only with the first page, from the maintained counters (see geo_counters.py)
+        counts = None
+        if after == 0:
+            counters = geo_counters.read_counters(cursor, level, [node_id]).get(node_id)
+            counts = {
+                'vles': counters['individual_vles'] + counters['cluster_vles'] if counters else 0,
+                'grampanchayats_covered': counters['gps_covered'] if counters else 0,
+                'grampanchayats_total': geo_cache.get().gp_total(level, node_id),
+            }
+
+        return jsonify({
+            'success': True,
+            'level': level,
+            'id': node_id,
+            'counts': counts,
+            'vles': vles,
+            'next_after': vles[-1]['id'] if len(vles) == limit else None
+        })
+    except Exception as e:
+        log.exception("Error in coverage")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        if 'cursor' in locals(): cursor.close()
+        if 'connection' in locals(): connection.close()
 
-        # Validate pincodes
-        if not validate_pincode(form_data['permPincode']):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid permanent address pincode (must be 6 digits)'
-            }), 400
-            
-        if (not form_data.get('sameCurrentAddress') and 
-            form_data.get('currPincode') and 
-            not validate_pincode(form_data['currPincode'])):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid current address pincode (must be 6 digits)'
-            }), 400
+# Per coverage level: the child level and how to list the children from the geography snapshot
+SUMMARY_LEVELS = {
+    None: ('division', lambda snapshot, node_id: snapshot.divisions),
+    'division': ('district', lambda snapshot, node_id: snapshot.districts_of(node_id)),
+    'district': ('block', lambda snapshot, node_id: snapshot.blocks_of(node_id)),
+    'block': ('gp', lambda snapshot, node_id: snapshot.grampanchayats_of(node_id)),
+    'gp': (None, lambda snapshot, node_id: ()),
+}
+
+@app.route('/coverage_summary', methods=['GET'])
+@app.route('/coverage_summary/<level>/<int:node_id>', methods=['GET'])
+@require_admin_token
+def coverage_summary(level=None, node_id=None):
+    """VLE counts by type and GPs covered vs total for the state or one node and each of its
+    children, plus new enrollments per day over the last ?days= (default 30).
+
+    Read from the geo_counters/geo_daily_enrollments tables that submit and
+    update keep current, so the cost doesn't grow with vle_details.
+    """
+    if level not in SUMMARY_LEVELS:
+        return jsonify({'success': False, 'message': 'Level must be gp, block, district or division'}), 400
+    snapshot = geo_cache.get()
+    nodes_by_id = {
+        'division': snapshot.division_by_id,
+        'district': snapshot.district_by_id,
+        'block': snapshot.block_by_id,
+        'gp': snapshot.gp_by_code,
+    }
+    if level is not None and node_id not in nodes_by_id[level]:
+        return jsonify({'success': False, 'message': f'Unknown {level} {node_id}'}), 404
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    child_level, children_of = SUMMARY_LEVELS[level]
+    children = children_of(snapshot, node_id)
+    empty = {'individual_vles': 0, 'cluster_vles': 0, 'gps_covered': 0}
 
-        # Validate CIBIL score
-        cibil_score = form_data.get('cibilScore', '')
-        if not cibil_score.isdigit() or not (300 <= int(cibil_score) <= 900):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid CIBIL score (must be 300-900)'
-            }), 400
-
-        # Process addresses
-        perm_address = ", ".join(filter(None, [
-            form_data['permAddressLine1'],
-            form_data.get('permAddressLine2'),
-            f"{form_data['permCity']} - {form_data['permPincode']}"
-        ]))
-        
-        same_current_address = 'sameCurrentAddress' in form_data
-        if same_current_address:
-            curr_address = perm_address
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        child_counts = geo_counters.read_counters(cursor, child_level, [row[0] for row in children])
+        children = [
+            {'id': row[0], 'name': row[1], **child_counts.get(row[0], empty),
+             'gps_total': snapshot.gp_total(child_level, row[0])}
+            for row in children
+        ]
+        if level is None:
+            # Every VLE's GPs lie in one block, so division counts add up to the state's
+            counts = {column: sum(child[column] for child in children) for column in empty}
+            counts['gps_total'] = len(snapshot.grampanchayats)
+            enrollments = geo_counters.read_enrollments(cursor, 'division', None, days)
         else:
-            curr_address = ", ".join(filter(None, [
-                form_data.get('currAddressLine1', ''),
-                form_data.get('currAddressLine2', ''),
-                f"{form_data.get('currCity', '')} - {form_data.get('currPincode', '')}" 
-                if form_data.get('currCity') else None
-            ])) or None
-
-        # Get grampanchayat details
-        cursor.execute("SELECT LGD_Code, name FROM grampanchayats WHERE LGD_Code IN (%s)" % 
-                      ','.join(['%s']*len(grampanchayat_ids)), grampanchayat_ids)
-        gp_results = cursor.fetchall()
-        
-        if len(gp_results) != len(grampanchayat_ids):
-            return jsonify({
-                'success': False,
-                'message': 'One or more selected grampanchayats not found'
-            }), 400
-        
-        grampanchayat_names = [gp['name'] for gp in gp_results]
-        lgd_codes = [str(gp['LGD_Code']) for gp in gp_results]
+            counts = {**geo_counters.read_counters(cursor, level, [node_id]).get(node_id, empty),
+                      'gps_total': snapshot.gp_total(level, node_id)}
+            enrollments = geo_counters.read_enrollments(cursor, level, node_id, days)
+
+        return jsonify({
+            'success': True,
+            'level': level or 'state',
+            'id': node_id,
+            'name': nodes_by_id[level][node_id][1] if level else None,
+            'counts': counts,
+            'children': children,
+            'enrollments': enrollments
+        })
+    except Exception as e:
+        log.exception("Error in coverage_summary")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        if 'cursor' in locals(): cursor.close()
+        if 'connection' in locals(): connection.close()
 
-        # Get location names
-        cursor.execute("SELECT name FROM divisions WHERE id = %s", (form_data['division'],))
-        division_name = cursor.fetchone()['name']
-        
-        cursor.execute("SELECT name FROM districts WHERE id = %s", (form_data['district'],))
-        district_name = cursor.fetchone()['name']
-        
-        cursor.execute("SELECT name FROM blocks WHERE id = %s", (form_data['block'],))
-        block_name = cursor.fetchone()['name']
+@app.route('/export', methods=['GET'])
+@require_admin_token
+def export_records():
+    """Stream vle_details as CSV or JSONL (?format=), filtered by division, district, block,
+    vle_type, created_from and created_to; ?mask=1 masks Aadhar, PAN and account numbers"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in vle_export.FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or jsonl'}), 400
+    generate, mimetype = vle_export.FORMATS[export_format]
+    filters = {name: request.args.get(name) for name in vle_export.FILTERS}
+    mask = request.args.get('mask') == '1'
+
+    return Response(
+        stream_with_context(generate(filters, mask)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=vle_details.{export_format}'}
+    )
 
-        # Handle checkbox values
-        same_whatsapp = 'sameWhatsapp' in form_data
-        
-        # Prepare update data
-        data = {
-            'csc_id': csc_id,
-            'vle_type': vle_type,
-            'division': division_name,
-            'district': district_name,
-            'block': block_name,
-            'grampanchayat': ', '.join(grampanchayat_names),
-            'lgd_code': ', '.join(lgd_codes),
-            
-            # Personal Details
-            'first_name': form_data['firstName'],
-            'father_name': form_data['fatherName'],
-            'mother_name': form_data['motherName'],
-            'surname': form_data['surname'],
-            'dob': form_data['dob'],
-            'blood_group': form_data.get('blood_group', ''),
-            'gender': form_data['gender'],
-            'marital_status': form_data['maritalStatus'],
-            'spouse_name': form_data.get('spouseName', ''),
-            'num_children': int(form_data.get('numChildren', 0)) if form_data.get('numChildren') else None,
-            'anniversary_date': form_data.get('anniversary_date') or None,
-            'religion': form_data['religion'] if form_data['religion'] != 'Other' else form_data.get('otherReligion', ''),
-            'category': form_data['category'] if form_data['category'] != 'Other' else form_data.get('otherCategory', ''),
-            'caste': form_data.get('caste', ''),
-            'education': form_data['education'] if form_data['education'] != 'Other' else form_data.get('otherEducation', ''),
-            'institute_name': form_data['instituteName'],
-            'cibil_score': int(cibil_score),
-
-            # Contact Details
-            'contact_number': form_data['contactNumber'],
-            'whatsapp_number': form_data['contactNumber'] if same_whatsapp else form_data.get('whatsappNumber', ''),
-            'email': form_data['email'],
-            
-            # Address Details
-            'permanent_address': perm_address,
-            'current_address': curr_address,
-            
-            # Identification Details
-            'pan_number': form_data.get('panNumber', ''),
-            'aadhar_number': form_data.get('aadharNumber', ''),
-            
-            # Bank Details
-            'bank_name': form_data['bankName'] if form_data.get('bankName') != 'Other' else form_data.get('otherBank', ''),
-            'ifsc_code': form_data.get('ifsc', ''),
-            'account_number': form_data.get('accountNumber', ''),
-            'branch_name': form_data.get('branchName', '')
-        }
+VALIDATE_BATCH_MAX = int(os.getenv('VALIDATE_BATCH_MAX', 5000))
+
+@app.route('/validate_batch', methods=['POST'])
+def validate_batch():
+    """Pre-check candidate records without enrolling them.
+
+    Body: a JSON list of records (or {"records": [...]}) keyed by the form's
+    field names; 'grampanchayat' may be a list or comma-separated LGD codes.
+    Every record gets all of submit_form's checks against the in-memory
+    geography; only rows with errors are listed, by 0-based index.
+    """
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        return jsonify({'success': False, 'message': 'Expected a JSON list of records'}), 400
+    if len(records) > VALIDATE_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'At most {VALIDATE_BATCH_MAX} records per call'}), 413
+
+    snapshot = geo_cache.get()
+    results = []
+    for index, item in enumerate(records):
+        if not isinstance(item, dict):
+            results.append({'row': index, 'errors': [{'field': None, 'message': 'Record must be an object'}]})
+            continue
+        errors, _ = validate_record(record_from_json(item), snapshot)
+        if errors:
+            results.append({'row': index, 'errors': errors})
+
+    return jsonify({
+        'success': True,
+        'total': len(records),
+        'valid': len(records) - len(results),
+        'invalid': len(results),
+        'results': results
+    })
+
+# Columns update_record may change (csc_id identifies the record)
+UPDATABLE_COLUMNS = [column for column in vle_import.COLUMNS if column != 'csc_id']
+
+def changed_columns(stored, data):
+    """{column: [old, new]} for the columns whose submitted value differs from the stored row.
+
+    Values are compared as text (dates and numbers come back typed from MySQL);
+    NULL and empty string count as the same.
+    """
+    def as_text(value):
+        return '' if value is None else str(value)
+    return {
+        column: [stored[column], data[column]]
+        for column in UPDATABLE_COLUMNS
+        if as_text(stored[column]) != as_text(data[column])
+    }
+
+# vle_change_log keeps these identifiers masked like the confirmation email
+CHANGE_LOG_MASKS = {
+    'aadhar_number': email_render.mask_aadhar,
+    'pan_number': email_render.mask_pan,
+    'account_number': email_render.mask_account,
+}
+
+def change_log_entry(changes):
+    """changed_columns() output as stored in vle_change_log, with identifiers masked"""
+    return {
+        column: [CHANGE_LOG_MASKS[column](value) if value and column in CHANGE_LOG_MASKS else value
+                 for value in values]
+        for column, values in changes.items()
+    }
 
-        # Update query
-        query = """
-        UPDATE vle_details SET
-            vle_type = %(vle_type)s,
-            division = %(division)s,
-            district = %(district)s,
-            block = %(block)s,
-            grampanchayat = %(grampanchayat)s,
-            lgd_code = %(lgd_code)s,
-            first_name = %(first_name)s,
-            father_name = %(father_name)s,
-            mother_name = %(mother_name)s,
-            surname = %(surname)s,
-            dob = %(dob)s,
-            blood_group = %(blood_group)s,
-            gender = %(gender)s,
-            marital_status = %(marital_status)s,
-            spouse_name = %(spouse_name)s,
-            num_children = %(num_children)s,
-            anniversary_date = %(anniversary_date)s,
-            religion = %(religion)s,
-            category = %(category)s,
-            caste = %(caste)s,
-            education = %(education)s,
-            institute_name = %(institute_name)s,
-            contact_number = %(contact_number)s,
-            whatsapp_number = %(whatsapp_number)s,
-            email = %(email)s,
-            permanent_address = %(permanent_address)s,
-            current_address = %(current_address)s,
-            pan_number = %(pan_number)s,
-            aadhar_number = %(aadhar_number)s,
-            bank_name = %(bank_name)s,
-            ifsc_code = %(ifsc_code)s,
-            account_number = %(account_number)s,
-            branch_name = %(branch_name)s,
-            cibil_score = %(cibil_score)s
-        WHERE csc_id = %(csc_id)s
-        """
-        
-        cursor.execute(query, data)
+@app.route('/update_record', methods=['POST'])
+def update_record():
+    try:
+        form_data = request.form
+        errors, location = validate_record(record_from_form(form_data), geo_cache.get(), first_only=True)
+        if errors:
+            return jsonify({'success': False, 'message': errors[0]['message']}), 400
+
+        data = build_vle_data(form_data, location)
+        csc_id = data['csc_id']
+
+        row_version = form_data.get('rowVersion', '')
+        if not row_version.isdigit():
+            return jsonify({'success': False, 'message': 'Missing record version, please search the record again'}), 400
+
+        # Lock the stored row, then write only what differs from it
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT id, row_version, created_at, {', '.join(UPDATABLE_COLUMNS)} FROM vle_details WHERE csc_id = %s FOR UPDATE",
+            (csc_id,))
+        existing = cursor.fetchone()
+        if not existing:
+            return jsonify({'success': False, 'message': 'Record not found'}), 404
+        if existing['row_version'] != int(row_version):
+            connection.rollback()
+            search_results.pop(existing['id'])
+            return jsonify({
+                'success': False,
+                'message': 'This record was changed by someone else after you opened it. Search it again to see the latest details.',
+                'row_version': existing['row_version']
+            }), 409
+
+        changes = changed_columns(existing, data)
+        if not changes:
+            connection.rollback()
+            return jsonify({'success': True, 'message': 'No changes to save', 'row_version': existing['row_version']})
+
+        new_version = existing['row_version'] + 1
+        assignments_set = ', '.join(f"{column} = %({column})s" for column in changes)
+        cursor.execute(
+            f"UPDATE vle_details SET {assignments_set}, row_version = %(row_version)s WHERE id = %(id)s",
+            {**{column: data[column] for column in changes}, 'row_version': new_version, 'id': existing['id']})
+        if 'lgd_code' in changes:
+            write_assignments(cursor, existing['id'], location['lgd_codes'])
+        if 'lgd_code' in changes or 'vle_type' in changes:
+            geo_counters.apply(
+                cursor,
+                (existing['vle_type'], geo_counters.parse_lgd_codes(existing['lgd_code'])),
+                (data['vle_type'], location['lgd_codes']),
+                existing['created_at'].date())
+        cursor.execute(
+            "INSERT INTO vle_change_log (vle_id, row_version, changes) VALUES (%s, %s, %s)",
+            (existing['id'], new_version, json.dumps(change_log_entry(changes), default=str)))
         connection.commit()
-        
-        return jsonify({'success': True, 'message': 'Record updated successfully!'})
+        identifier_index.add(data)
+        name_search.upsert(existing['id'], data)
+        search_results.pop(existing['id'])
+
+        return jsonify({'success': True, 'message': 'Record updated successfully!', 'row_version': new_version})
     
     except Exception as e:
+        log.exception("Error in update_record")
         return jsonify({'success': False, 'message': str(e)}), 500
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'connection' in locals(): connection.close()
 
+@app.cli.command('backfill-assignments')
+@click.option('--batch-size', default=1000, show_default=True)
+def backfill_assignments_command(batch_size):
+    """One-time migration: fill vle_grampanchayats from the comma-joined vle_details.lgd_code text"""
+    snapshot = geo_cache.get()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        last_id, rows_seen, links = 0, 0, 0
+        while True:
+            cursor.execute(
+                "SELECT id, lgd_code FROM vle_details WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            pairs = []
+            for vle_id, lgd_code in rows:
+                codes = [code.strip() for code in str(lgd_code or '').split(',') if code.strip().isdigit()]
+                pairs.extend(assignment_rows(vle_id, codes, snapshot))
+            if pairs:
+                cursor.executemany(
+                    "INSERT IGNORE INTO vle_grampanchayats "
+                    "(vle_id, lgd_code, block_id, district_id, division_id) "
+                    "VALUES (%s, %s, %s, %s, %s)", pairs)
+            connection.commit()
+            last_id = rows[-1][0]
+            rows_seen += len(rows)
+            links += len(pairs)
+        cursor.close()
+    finally:
+        connection.close()
+    print(f"Backfilled {links} assignments from {rows_seen} vle_details rows")
+
+@app.cli.command('import-vles')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=500, show_default=True, help='rows per multi-row upsert and transaction')
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False),
+              help='where rejected rows are written (default: <csv>.rejects.csv)')
+@click.option('--resume', is_flag=True, help='continue after the last committed batch of a previous run')
+def import_vles_command(csv_path, batch_size, rejects_path, resume):
+    """Bulk import VLE records from a CSV shaped like abcd.csv (no confirmation emails are sent)"""
+    vle_import.run_import(csv_path, batch_size, rejects_path, resume, echo=print)
+    # Imported rows bypass the incremental counter updates
+    print(f"Rebuilt geography counters ({geo_counters.reconcile()} rows)")
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute the per-geography VLE counters from the assignment table (reconciliation)"""
+    started = time.monotonic()
+    rows = geo_counters.reconcile()
+    print(f"Rebuilt {rows} geography counter rows in {time.monotonic() - started:.2f}s")
+
+@app.cli.command('export-vles')
+@click.option('--format', 'export_format', type=click.Choice(list(vle_export.FORMATS)), default='csv')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='file to write (default: stdout)')
+@click.option('--division')
+@click.option('--district')
+@click.option('--block')
+@click.option('--vle-type', type=click.Choice(['individual', 'cluster']))
+@click.option('--created-from', help='YYYY-MM-DD, inclusive')
+@click.option('--created-to', help='YYYY-MM-DD, exclusive')
+@click.option('--mask', is_flag=True, help='mask Aadhar, PAN and account numbers')
+def export_vles_command(export_format, output, mask, **filters):
+    """Stream vle_details to CSV or JSONL with constant memory"""
+    generate, _ = vle_export.FORMATS[export_format]
+    for chunk in generate(filters, mask):
+        output.write(chunk)
+
+@app.cli.command('check-search-plan')
+@click.argument('term', default='000000000000')
+def check_search_plan_command(term):
+    """Fail if EXPLAIN shows search_record scanning vle_details instead of using its indexes"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("EXPLAIN " + SEARCH_RECORD_QUERY, {'term': normalize_identifier(term)})
+        plan = cursor.fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    problems = []
+    for row in plan:
+        print(f"{row.get('id')} {row.get('select_type')} {row.get('table')} type={row.get('type')} key={row.get('key')}")
+        # vle_details appears under its own name in the union branches and as 'v' in the outer join
+        if row.get('table') in ('v', 'vle_details') and (row.get('type') == 'ALL' or not row.get('key')):
+            problems.append(row)
+    if problems:
+        raise click.ClickException(f"search_record does a full scan of vle_details in {len(problems)} step(s)")
+    print("OK: every vle_details access in search_record uses an index")
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    snapshot = geo_cache.get()
+    return jsonify({
+        'db_pool': pool_stats(),
+        'email_outbox': outbox.stats(),
+        'smtp': mailer.stats(),
+        'identifiers': identifier_index.stats(),
+        'name_search': name_search.stats(),
+        'logging': structured_log.stats(),
+        'search_cache': {'terms': search_terms.stats(), 'records': search_results.stats(),
+                         'sync': search_cache_sync.stats()},
+        'geography': {'version': snapshot.version, 'loaded_at': snapshot.loaded_at, **snapshot.counts()}
+    })
+
+
+warm_caches()
+
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=port)
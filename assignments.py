@@ -0,0 +1,40 @@
+import geo_cache
+
+
+INSERT_ASSIGNMENT = (
+    "INSERT INTO vle_grampanchayats (vle_id, lgd_code, block_id, district_id, division_id) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+
+def assignment_rows(vle_id, lgd_codes, snapshot=None):
+    """vle_grampanchayats rows for a VLE, denormalized with each GP's block/district/division"""
+    snapshot = snapshot or geo_cache.get()
+    rows = []
+    for code in lgd_codes:
+        ancestors = snapshot.ancestors_of_gp(int(code))
+        if ancestors:
+            rows.append((vle_id, int(code), *ancestors))
+    return rows
+
+
+def write_assignments(cursor, vle_id, lgd_codes):
+    """Replace a VLE's rows in the vle_grampanchayats assignment table"""
+    cursor.execute("DELETE FROM vle_grampanchayats WHERE vle_id = %s", (vle_id,))
+    cursor.executemany(INSERT_ASSIGNMENT, assignment_rows(vle_id, lgd_codes))
+
+
+def write_assignments_bulk(cursor, codes_by_vle_id, snapshot=None):
+    """Replace the assignments of many VLEs with one DELETE and one multi-row INSERT"""
+    if not codes_by_vle_id:
+        return
+    snapshot = snapshot or geo_cache.get()
+    vle_ids = list(codes_by_vle_id)
+    cursor.execute(
+        "DELETE FROM vle_grampanchayats WHERE vle_id IN (%s)" % ','.join(['%s'] * len(vle_ids)),
+        vle_ids)
+    rows = []
+    for vle_id, codes in codes_by_vle_id.items():
+        rows.extend(assignment_rows(vle_id, codes, snapshot))
+    if rows:
+        cursor.executemany(INSERT_ASSIGNMENT, rows)
@@ -0,0 +1,123 @@
+"""Confirmation email rendering: renders/sec before and after precompiled templates.
+
+"before" reproduces the old send_confirmation_email body building: masking
+closures, Flask render_template inside an app context and the inline
+f-string text body. "after" is email_render.render_confirmation.
+
+    python bench/email_render_bench.py --renders 5000
+
+Recorded result: four runs in review gave after/before ratios of 0.84,
+1.22, 1.14 and 0.99, i.e. no speed-up beyond run-to-run noise. Flask's
+render_template already caches compiled templates, so per-render cost is
+the same. What precompiling buys is that rendering needs no app context
+(the outbox threads call it directly) and the masking helpers are not
+rebuilt for every email, not throughput.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, render_template  # noqa: E402
+
+import email_render  # noqa: E402
+
+
+SAMPLE = {
+    'vle_type': 'cluster', 'csc_id': '123456780012', 'division': 'PUNE', 'district': 'Pune',
+    'block': 'Haveli', 'grampanchayat': 'Shivapur, Shriramnagar', 'lgd_code': '237302, 237303',
+    'first_name': 'Vipul', 'father_name': 'Tayaji', 'mother_name': 'Pushpalata', 'surname': 'Bambale',
+    'dob': '1991-03-03', 'blood_group': 'AB+', 'gender': 'Male', 'marital_status': 'Married',
+    'spouse_name': 'Ekta', 'num_children': 1, 'anniversary_date': '2018-04-01', 'religion': 'Hindu',
+    'category': 'ST', 'caste': 'MK', 'education': 'Post-Graduation',
+    'institute_name': 'Savitribai Phule Pune University', 'cibil_score': 721,
+    'contact_number': '7387367944', 'whatsapp_number': '7387367944', 'email': 'vle@example.com',
+    'permanent_address': 'Flat no. 20, Pandavnagar, Pune - 411016',
+    'current_address': 'Flat no. 20, Pandavnagar, Pune - 411016',
+    'pan_number': 'DPBPB4509C', 'aadhar_number': '414452851213', 'bank_name': 'HDFC Bank',
+    'ifsc_code': 'HDFC0123456', 'account_number': '12345678910', 'branch_name': 'FC Road',
+}
+
+app = Flask(__name__, template_folder=email_render.TEMPLATE_DIR)
+
+
+def legacy_render(form_data):
+    def mask_aadhar(aadhar):
+        return f"**** **** {aadhar[-4:]}" if aadhar and len(aadhar) >= 4 else 'Not provided'
+
+    def mask_pan(pan):
+        return f"{pan[:2]}*****{pan[-2:]}" if pan and len(pan) >= 4 else 'Not provided'
+
+    def mask_account(account):
+        return f"****{account[-4:]}" if account and len(account) >= 4 else 'Not provided'
+
+    email_data = {
+        **form_data,
+        'aadhar_number': mask_aadhar(form_data.get('aadhar_number')),
+        'pan_number': mask_pan(form_data.get('pan_number')),
+        'account_number': mask_account(form_data.get('account_number')),
+        'dob': form_data.get('dob', 'Not provided'),
+        'anniversary_date': form_data.get('anniversary_date', 'Not provided'),
+        'submitted_year': datetime.now().year,
+    }
+    with app.app_context():
+        html_content = render_template('email_confirmation.html', **email_data)
+    text_content = f"""VLE Details Submission Confirmation
+        Dear {form_data['first_name']} {form_data['surname']},
+        - VLE Type: {form_data['vle_type']}
+        - CSC ID: {form_data['csc_id']}
+        - Full Name: {form_data['first_name']} {form_data['surname']}
+        - Father's Name: {form_data['father_name']}
+        - Mother's Name: {form_data['mother_name']}
+        - Date of Birth: {form_data.get('dob', 'Not provided')}
+        - Gender: {form_data['gender']}
+        - Marital Status: {form_data['marital_status']}
+        - Spouse Name: {form_data.get('spouse_name', 'N/A')}
+        - Number of Children: {form_data.get('num_children', '0')}
+        - Blood Group: {form_data.get('blood_group', 'N/A')}
+        - Mobile Number: {form_data['contact_number']}
+        - WhatsApp Number: {form_data['whatsapp_number']}
+        - Email Address: {form_data['email']}
+        - Permanent Address: {form_data['permanent_address']}
+        - Current Address: {form_data.get('current_address', 'Same as permanent address')}
+        - PAN Number: {mask_pan(form_data.get('pan_number'))}
+        - Aadhar Number: {mask_aadhar(form_data.get('aadhar_number'))}
+        - Bank Name: {form_data['bank_name']}
+        - Account Number: {mask_account(form_data.get('account_number'))}
+        - IFSC Code: {form_data.get('ifsc_code', 'Not provided')}
+        - Branch Name: {form_data.get('branch_name', 'Not provided')}
+        - Division: {form_data['division']}
+        - District: {form_data['district']}
+        - Block: {form_data['block']}
+        - Grampanchayat: {form_data['grampanchayat']}
+        - LGD Code: {form_data['lgd_code']}
+        """
+    return text_content, html_content
+
+
+def measure(render, renders):
+    render(SAMPLE)  # warm up template caches
+    started = time.perf_counter()
+    for _ in range(renders):
+        render(SAMPLE)
+    return renders / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--renders', type=int, default=5000)
+    args = parser.parse_args()
+
+    before = measure(legacy_render, args.renders)
+    after = measure(email_render.render_confirmation, args.renders)
+    print(f"{args.renders} renders")
+    print(f"  before (render_template + f-string)  {before:10.1f} renders/s")
+    print(f"  after  (precompiled templates)       {after:10.1f} renders/s")
+    print(f"  after / before                        {after / before:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
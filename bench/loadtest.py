@@ -0,0 +1,276 @@
+"""End-to-end load test of the registration flows against a running app.
+
+Each simulated user repeats what a field operator does: load the form and the
+geography bundle, walk the division -> district -> block -> GP cascade,
+submit a new synthetic VLE, search for it and save an edit. Latencies are
+reported per route (throughput, p50/p95/p99) and can be saved as JSON and
+compared with an earlier run to catch regressions between releases.
+
+The app needs a local MySQL loaded with the schema and geography
+(`flask load-geography`), and outgoing mail pointed at the SMTP sink:
+
+    python bench/smtp_sink.py --port 2525 &
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=0 \\
+        gunicorn -c gunicorn.conf.py app:app
+    python bench/loadtest.py --base-url http://127.0.0.1:5000 --users 50 --duration 120 \\
+        --json results.json --baseline previous.json
+
+(--start-sink PORT runs the sink inside this process instead.) A SQLite
+stand-in isn't offered: the app relies on MySQL features such as
+SKIP LOCKED and ON DUPLICATE KEY UPDATE.
+
+Every run creates new VLE rows with CSC IDs starting with the run prefix
+(--prefix, random by default); point it at a scratch database.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import string
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import smtp_sink
+
+
+ROUTES = [
+    'index', 'geography_bundle', 'get_divisions', 'get_districts', 'get_blocks',
+    'get_grampanchayats', 'submit_form', 'search_record', 'update_record',
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {route: [] for route in ROUTES}
+        self.errors = {route: 0 for route in ROUTES}
+        self.first_errors = {}
+
+    def add(self, route, elapsed, error=None):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if error:
+                self.errors[route] += 1
+                self.first_errors.setdefault(route, error)
+
+
+class SimulatedUser:
+    def __init__(self, base_url, recorder, prefix, counter, think, cluster_share):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.prefix = prefix
+        self.counter = counter
+        self.think = think
+        self.cluster_share = cluster_share
+
+    def call(self, route, path, form=None, expect_json=True):
+        """Request `path`, record its latency and return the parsed JSON (or None on failure)"""
+        data = urllib.parse.urlencode(form, doseq=True).encode() if form is not None else None
+        started = time.perf_counter()
+        error = None
+        body = None
+        try:
+            with urllib.request.urlopen(self.base_url + path, data=data, timeout=60) as response:
+                raw = response.read()
+            if expect_json:
+                body = json.loads(raw)
+                if isinstance(body, dict) and body.get('success') is False:
+                    error = body.get('message', 'success: false')
+        except urllib.error.HTTPError as e:
+            error = f"HTTP {e.code}: {e.read()[:200].decode('utf-8', 'replace')}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.recorder.add(route, time.perf_counter() - started, error)
+        if self.think:
+            time.sleep(random.uniform(0, self.think))
+        return None if error else (body if expect_json else True)
+
+    def pick_location(self):
+        divisions = self.call('get_divisions', '/get_divisions')
+        if not divisions:
+            return None
+        division = random.choice(divisions)[0]
+        districts = self.call('get_districts', f'/get_districts/{division}')
+        if not districts:
+            return None
+        district = random.choice(districts)[0]
+        blocks = self.call('get_blocks', f'/get_blocks/{district}')
+        if not blocks:
+            return None
+        block = random.choice(blocks)[0]
+        gps = self.call('get_grampanchayats', f'/get_grampanchayats/{block}')
+        if not gps:
+            return None
+        codes = [str(gp[0]) for gp in gps]
+        if len(codes) >= 2 and random.random() < self.cluster_share:
+            return 'cluster', division, district, block, random.sample(codes, random.randint(2, min(4, len(codes))))
+        return 'individual', division, district, block, [random.choice(codes)]
+
+    def synthetic_form(self, location):
+        vle_type, division, district, block, gps = location
+        n = next(self.counter)
+        csc_id = f"{self.prefix:03d}{n:05d}00{n % 100:02d}"
+        letters = lambda k: ''.join(random.choices(string.ascii_letters, k=k))  # noqa: E731
+        return {
+            'idempotencyKey': f"loadtest-{csc_id}",
+            'employeeType': vle_type,
+            'division': division,
+            'district': district,
+            'block': block,
+            'grampanchayat': gps,
+            'cscId': csc_id,
+            'firstName': letters(7),
+            'fatherName': letters(6),
+            'motherName': letters(6),
+            'surname': letters(8),
+            'dob': f"{random.randint(1965, 2003)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+            'blood_group': random.choice(['A+', 'B+', 'O+', 'AB+']),
+            'gender': random.choice(['Male', 'Female']),
+            'maritalStatus': 'Single',
+            'religion': 'Hindu',
+            'category': 'General',
+            'education': 'Graduate',
+            'instituteName': 'Load Test College',
+            'cibilScore': str(random.randint(300, 900)),
+            'contactNumber': f"9{random.randint(0, 999999999):09d}",
+            'sameWhatsapp': 'on',
+            'email': f"vle{csc_id}@example.com",
+            'permAddressLine1': f"{random.randint(1, 500)} Main Road",
+            'permCity': 'Pune',
+            'permPincode': f"{random.randint(400001, 445999)}",
+            'sameCurrentAddress': 'on',
+            'panNumber': f"{letters(5).upper()}{random.randint(1000, 9999)}{letters(1).upper()}",
+            'aadharNumber': f"{random.randint(10 ** 11, 10 ** 12 - 1) // 10 * 10 + 1}",
+            'bankName': 'State Bank of India',
+            'ifsc': 'SBIN0000001',
+            'accountNumber': str(random.randint(10 ** 10, 10 ** 11)),
+            'branchName': 'Pune',
+        }
+
+    def session(self):
+        self.call('index', '/', expect_json=False)
+        self.call('geography_bundle', '/geography_bundle')
+
+        location = self.pick_location()
+        if location is None:
+            return
+        form = self.synthetic_form(location)
+        if not self.call('submit_form', '/submit_form', form):
+            return
+
+        found = self.call('search_record', '/search_record?' + urllib.parse.urlencode({'term': form['cscId']}))
+        if not found:
+            return
+        edit = dict(form, instituteName='Load Test University', rowVersion=found['record'].get('row_version', 1))
+        edit.pop('idempotencyKey')
+        self.call('update_record', '/update_record', edit)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(recorder, elapsed):
+    results = {}
+    for route in ROUTES:
+        values = sorted(recorder.latencies[route])
+        if not values:
+            continue
+        results[route] = {
+            'requests': len(values),
+            'errors': recorder.errors[route],
+            'rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    return results
+
+
+def print_report(results, baseline=None, tolerance=0.2):
+    """Print the per-route table; returns the routes that regressed against `baseline`"""
+    regressions = []
+    print(f"{'route':<20}{'reqs':>7}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route, r in results.items():
+        line = (f"{route:<20}{r['requests']:>7}{r['errors']:>6}{r['rps']:>9.1f}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}")
+        before = (baseline or {}).get(route)
+        if before:
+            change = (r['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+            line += f"  p95 {change:+.0%} vs baseline"
+            if change > tolerance:
+                regressions.append(route)
+                line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to keep starting sessions')
+    parser.add_argument('--ramp-up', type=float, default=10, help='seconds over which users start')
+    parser.add_argument('--think', type=float, default=0.0, help='max random pause between requests')
+    parser.add_argument('--cluster-share', type=float, default=0.2, help='share of cluster VLEs')
+    parser.add_argument('--prefix', type=int, default=random.randint(100, 999),
+                        help='3-digit CSC ID prefix marking this run\'s rows')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--start-sink', type=int, metavar='PORT', help='run the SMTP sink in this process')
+    parser.add_argument('--json', dest='json_path', help='write the results here')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare p95 against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 increase vs baseline')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    sink = smtp_sink.start_in_thread(port=args.start_sink) if args.start_sink else None
+
+    recorder = Recorder()
+    counter = itertools.count(1)  # shared by all users; next() on it is atomic
+
+    deadline = time.monotonic() + args.duration
+
+    def run_user(index):
+        time.sleep(args.ramp_up * index / max(1, args.users))
+        user = SimulatedUser(args.base_url, recorder, args.prefix, counter, args.think, args.cluster_share)
+        while time.monotonic() < deadline:
+            user.session()
+
+    print(f"{args.users} users for {args.duration:.0f}s against {args.base_url} (CSC prefix {args.prefix:03d})")
+    started = time.monotonic()
+    threads = [threading.Thread(target=run_user, args=(i,), daemon=True) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    results = summarize(recorder, elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+    regressions = print_report(results, baseline, args.tolerance)
+    for route, error in recorder.first_errors.items():
+        print(f"first {route} error: {error}")
+    if sink:
+        print(f"SMTP sink: sessions={sink.stats.sessions} messages={sink.stats.messages}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'users': args.users, 'duration': elapsed, 'base_url': args.base_url,
+                       'routes': results}, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Local SMTP stand-in for development, load tests and benchmarks.
+
+Accepts and discards every message (optionally printing or counting them) so
+the outbox and mail delivery can be exercised without a real relay:
+
+    python bench/smtp_sink.py --port 2525
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=0 flask drain-outbox
+
+--fail-rate makes the sink answer a share of messages with a transient 451
+and --delay adds latency per message, to exercise retries and backoff.
+--connect-delay stalls the greeting to mimic a remote relay's TCP, TLS and
+AUTH handshake.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SinkStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.messages = 0
+        self.rejected = 0
+
+    def add(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.stats.add('sessions')
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+        self.reply('220 smtp-sink ESMTP ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                self.wfile.write(b'250-smtp-sink\r\n250-PIPELINING\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN\r\n')
+            elif verb == 'HELO':
+                self.reply('250 smtp-sink')
+            elif verb == 'AUTH':
+                self.reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data)
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.fail_rate and random.random() < server.fail_rate:
+                    server.stats.add('rejected')
+                    self.reply('451 Temporary local problem, try again')
+                    continue
+                server.stats.add('messages')
+                if server.verbose:
+                    print(b''.join(lines).decode('utf-8', 'replace'))
+                self.reply('250 Message accepted')
+            elif verb == 'STARTTLS':
+                self.reply('454 TLS not available')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fail_rate=0.0, delay=0.0, verbose=False, connect_delay=0.0):
+        super().__init__(address, SMTPSinkHandler)
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.connect_delay = connect_delay
+        self.verbose = verbose
+        self.stats = SinkStats()
+
+
+def start_in_thread(host='127.0.0.1', port=0, **kwargs):
+    """Start a sink on a background thread; returns it (its port is sink.server_address[1])"""
+    sink = SMTPSink((host, port), **kwargs)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--connect-delay', type=float, default=0.0)
+    parser.add_argument('--verbose', action='store_true', help='print every accepted message')
+    args = parser.parse_args()
+
+    sink = SMTPSink((args.host, args.port), args.fail_rate, args.delay, args.verbose, args.connect_delay)
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"sessions={sink.stats.sessions} messages={sink.stats.messages} rejected={sink.stats.rejected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Confirmation-mail throughput: a new SMTP connection per message vs. reused sessions.
+
+Runs against the local SMTP sink (started in-process unless --port is given)
+and prints messages/sec for each strategy:
+
+    python bench/smtp_throughput.py --messages 500 --concurrency 4 --connect-delay 0.05
+
+--connect-delay stands in for the TCP + STARTTLS + AUTH round trips of a
+remote relay, which is what session reuse saves.
+"""
+import argparse
+import os
+import smtplib
+import sys
+import threading
+import time
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mailer  # noqa: E402
+import smtp_sink  # noqa: E402
+
+
+def build_message(i):
+    msg = MIMEText(f"Benchmark message {i}\n" + "x" * 4000)
+    msg['Subject'] = f"Benchmark {i}"
+    msg['From'] = 'bench@example.com'
+    msg['To'] = f"vle{i}@example.com"
+    return ('bench@example.com', [f"vle{i}@example.com"], msg.as_string())
+
+
+def run_threads(concurrency, messages, work):
+    chunks = [messages[i::concurrency] for i in range(concurrency)]
+    threads = [threading.Thread(target=work, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def connect_per_message(host, port):
+    def work(chunk):
+        for from_addr, to_addrs, message in chunk:
+            with smtplib.SMTP(host, port, timeout=30) as server:
+                server.sendmail(from_addr, to_addrs, message)
+    return work
+
+
+def reused_sessions(relay, batch_size):
+    def work(chunk):
+        for i in range(0, len(chunk), batch_size):
+            errors = [e for e in relay.send_many(chunk[i:i + batch_size]) if e is not None]
+            if errors:
+                raise errors[0]
+    return work
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--connect-delay', type=float, default=0.02,
+                        help='seconds the in-process sink stalls before its greeting')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='use an already running sink instead')
+    args = parser.parse_args()
+
+    port = args.port
+    if port is None:
+        sink = smtp_sink.start_in_thread(args.host, 0, connect_delay=args.connect_delay)
+        port = sink.server_address[1]
+
+    messages = [build_message(i) for i in range(args.messages)]
+    relay = mailer.SMTPRelay(args.host, port, starttls=False, max_sessions=args.concurrency,
+                             max_messages=1000)
+
+    results = [
+        ('connect per message', run_threads(args.concurrency, messages, connect_per_message(args.host, port))),
+        ('reused sessions', run_threads(args.concurrency, messages, reused_sessions(relay, args.batch_size))),
+    ]
+    relay.close()
+
+    print(f"{args.messages} messages, concurrency {args.concurrency}, connect delay {args.connect_delay}s")
+    for name, elapsed in results:
+        print(f"  {name:<22} {elapsed:8.3f}s  {args.messages / elapsed:10.1f} msg/s")
+    print(f"  relay stats: {relay.stats()}")
+
+
+if __name__ == '__main__':
+    main()
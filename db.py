@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+import metrics
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the wait timeout"""
+
+
+class InstrumentedCursor:
+    """Cursor proxy that reports statement and fetch time to metrics"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def _timed(self, record, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record(time.perf_counter() - started)
+
+    def execute(self, *args, **kwargs):
+        return self._timed(metrics.record_query, self._raw.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(metrics.record_query, self._raw.executemany, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed(metrics.record_fetch, self._raw.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(metrics.record_fetch, self._raw.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed(metrics.record_fetch, self._raw.fetchall)
+
+
+class PooledConnection:
+    """Thin wrapper around a MySQL connection whose close() returns it to the pool"""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._release(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections shared by all request threads.
+
+    Keeps up to `size` idle connections around and allows `max_overflow`
+    extra connections during bursts; those are closed instead of being
+    returned. Connections older than `recycle` seconds are replaced and every
+    checkout is health-checked with a ping when `pre_ping` is set.
+    """
+
+    def __init__(self, connect_kwargs, size=5, max_overflow=10, timeout=10.0,
+                 recycle=1800, pre_ping=True):
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._open = 0          # connections currently open (idle + checked out)
+        self._checked_out = 0
+
+        self._stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'overflow_closed': 0,
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        connection = mysql.connector.connect(**self.connect_kwargs)
+        metrics.CONNECT_SECONDS.observe(time.perf_counter() - started)
+        read_timeout = os.getenv('DB_READ_TIMEOUT')
+        if read_timeout:
+            # Server-side cap on SELECT runtime so a stuck query frees the connection
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION max_execution_time = %s", (int(float(read_timeout) * 1000),))
+            cursor.close()
+        with self._cond:
+            self._stats['connects'] += 1
+        return connection, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def get_connection(self):
+        acquire_started = time.perf_counter()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    self._checked_out += 1
+                    break
+                if self._open < self.size + self.max_overflow:
+                    raw, created_at = None, None
+                    self._open += 1
+                    self._checked_out += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a database connection")
+                waited = True
+                self._cond.wait(remaining)
+
+            waited_for = time.monotonic() - started
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += waited_for
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited_for)
+
+        # Connect, recycle and ping outside the lock so slow handshakes don't serialize checkouts
+        try:
+            if raw is not None and self.recycle and time.monotonic() - created_at > self.recycle:
+                with self._cond:
+                    self._stats['recycled'] += 1
+                self._discard(raw)
+                raw = None
+            if raw is not None and self.pre_ping and not raw.is_connected():
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                self._discard(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+        metrics.ACQUIRE_SECONDS.observe(time.perf_counter() - acquire_started)
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at):
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+            keep = raw.is_connected()
+        except Exception:
+            keep = False
+
+        with self._cond:
+            self._checked_out -= 1
+            if keep and len(self._idle) < self.size:
+                self._idle.append((raw, created_at))
+                raw = None
+            else:
+                self._open -= 1
+                if keep:
+                    self._stats['overflow_closed'] += 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._discard(raw)
+
+    def close_idle(self):
+        """Close every idle connection (checked-out ones are closed when released)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'overflow_in_use': max(0, self._open - self.size),
+                **self._stats,
+                'wait_time_avg': (self._stats['wait_time_total'] / self._stats['waits']
+                                  if self._stats['waits'] else 0.0),
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process's pool; a forked child builds its own instead of sharing the parent's sockets"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool_pid = os.getpid()
+                _pool = ConnectionPool(
+                    connect_kwargs={
+                        'host': os.getenv('DB_HOST'),
+                        'port': os.getenv('DB_PORT'),
+                        'user': os.getenv('DB_USER'),
+                        'password': os.getenv('DB_PASSWORD'),
+                        'database': os.getenv('DB_NAME'),
+                        'charset': 'utf8mb4',
+                        'connection_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 10)),
+                        # The pure-Python driver cooperates with gevent's patched sockets
+                        'use_pure': os.getenv('DB_USE_PURE', '0') == '1',
+                    },
+                    size=int(os.getenv('DB_POOL_SIZE', 5)),
+                    max_overflow=int(os.getenv('DB_POOL_MAX_OVERFLOW', 10)),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+                    pre_ping=os.getenv('DB_POOL_PRE_PING', '1') != '0',
+                )
+    return _pool
+
+
+def get_db_connection():
+    """Check out a pooled connection; calling close() on it returns it to the pool"""
+    return get_pool().get_connection()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def dispose():
+    """Close this process's idle connections and forget the pool.
+
+    Called by the gunicorn master before forking workers, so connections
+    opened while preloading the app are not inherited by the children.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.close_idle()
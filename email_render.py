@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Templates are compiled once at import; auto_reload is off so rendering never
+# stats the files again. No Flask app or request context is needed.
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+    keep_trailing_newline=True,
+)
+_html_template = _env.get_template('email_confirmation.html')
+_text_template = _env.get_template('email_confirmation.txt')
+
+
+def mask_aadhar(aadhar):
+    return f"**** **** {aadhar[-4:]}" if aadhar and len(aadhar) >= 4 else 'Not provided'
+
+
+def mask_pan(pan):
+    return f"{pan[:2]}*****{pan[-2:]}" if pan and len(pan) >= 4 else 'Not provided'
+
+
+def mask_account(account):
+    return f"****{account[-4:]}" if account and len(account) >= 4 else 'Not provided'
+
+
+def mask_identifiers(record):
+    """Copy of a vle_details record with Aadhar, PAN and account number masked (None if empty).
+
+    This is what gets queued in email_outbox; masking it again in
+    email_context leaves the values unchanged.
+    """
+    return {
+        **record,
+        'aadhar_number': mask_aadhar(record['aadhar_number']) if record.get('aadhar_number') else None,
+        'pan_number': mask_pan(record['pan_number']) if record.get('pan_number') else None,
+        'account_number': mask_account(record['account_number']) if record.get('account_number') else None,
+    }
+
+
+def email_context(form_data):
+    """Template variables for a submitted record, with identifiers masked"""
+    return {
+        **form_data,
+        'aadhar_number': mask_aadhar(form_data.get('aadhar_number')),
+        'pan_number': mask_pan(form_data.get('pan_number')),
+        'account_number': mask_account(form_data.get('account_number')),
+        # Format dates properly
+        'dob': form_data.get('dob', 'Not provided'),
+        'anniversary_date': form_data.get('anniversary_date', 'Not provided'),
+        'submitted_year': datetime.now().year,
+    }
+
+
+def render_confirmation(form_data):
+    """Return (text_body, html_body) for the confirmation email"""
+    context = email_context(form_data)
+    return _text_template.render(context), _html_template.render(context)
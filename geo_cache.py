@@ -0,0 +1,430 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from db import get_db_connection
+
+log = logging.getLogger(__name__)
+
+
+# Spelling variants of romanised Marathi place names, folded to one form so that
+# e.g. "Wadgaon", "Vadgav" and "Waadgaon" share a search key. Applied in order.
+SPELLING_RULES = (
+    (re.compile(r'aon\b'), 'av'),
+    (re.compile(r'ee'), 'i'),
+    (re.compile(r'oo'), 'u'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'z'), 'j'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'([bcdgjkpst])h'), r'\1'),
+    (re.compile(r'([a-z])\1+'), r'\1'),
+)
+
+
+def _key_words(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii').casefold()
+    text = ' '.join(re.findall(r'[a-z0-9]+', text))
+    for pattern, replacement in SPELLING_RULES:
+        text = pattern.sub(replacement, text)
+    return text.split()
+
+
+def search_key(text):
+    """Case-, accent- and spelling-insensitive form of a place name; words are joined without spaces"""
+    return ''.join(_key_words(text))
+
+
+# Letters that can turn the end of a partly typed query into a different
+# folded form: "Wadgao" + "n" folds to "vadgav", "P" + "h" to "f",
+# "Se" + "e" to "si", "Go" + "o" to "gu"
+PARTIAL_ENDINGS = ('h', 'e', 'o', 'n')
+
+
+def prefix_keys(query):
+    """Search keys a name starting with the partly typed `query` can begin with.
+
+    Folding is not prefix-stable ("Wadgao" folds to "vadgao" but "Wadgaon"
+    to "vadgav"), so the query is also folded as if the next letter typed
+    completed one of the SPELLING_RULES patterns.
+    """
+    key = search_key(query)
+    if not key:
+        return []
+    keys = [key]
+    for ending in PARTIAL_ENDINGS:
+        extended = search_key(query + ending)
+        if extended not in keys and not extended.startswith(key):
+            keys.append(extended)
+    return keys
+
+
+class GeoSnapshot:
+    """Immutable, parent-indexed copy of the divisions/districts/blocks/grampanchayats tables.
+
+    Rows keep the same tuple shape the tables return (`SELECT *`), so routes can
+    serve them as-is. Child rows are stored sorted by parent in one tuple per
+    level and each parent maps to a (start, stop) slice of it.
+    """
+
+    def __init__(self, divisions, districts, blocks, grampanchayats, version):
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.divisions = tuple(sorted(divisions))
+        self.districts = tuple(sorted(districts, key=lambda r: (r[2], r[0])))
+        self.blocks = tuple(sorted(blocks, key=lambda r: (r[2], r[0])))
+        self.grampanchayats = tuple(sorted(grampanchayats, key=lambda r: (r[2], r[0])))
+
+        self.division_by_id = {r[0]: r for r in self.divisions}
+        self.district_by_id = {r[0]: r for r in self.districts}
+        self.block_by_id = {r[0]: r for r in self.blocks}
+        self.gp_by_code = {r[0]: r for r in self.grampanchayats}
+
+        self._district_slices = self._slices(self.districts)
+        self._block_slices = self._slices(self.blocks)
+        self._gp_slices = self._slices(self.grampanchayats)
+
+        self._bundles = {}
+        self._bundles_lock = threading.Lock()
+
+        self._gp_keys = None
+        self._gp_keys_lock = threading.Lock()
+
+    @staticmethod
+    def _slices(rows):
+        slices = {}
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i][2] != rows[start][2]:
+                slices[rows[start][2]] = (start, i)
+                start = i
+        return slices
+
+    @staticmethod
+    def _children(rows, slices, parent_id):
+        try:
+            start, stop = slices[int(parent_id)]
+        except (KeyError, TypeError, ValueError):
+            return ()
+        return rows[start:stop]
+
+    def districts_of(self, division_id):
+        return self._children(self.districts, self._district_slices, division_id)
+
+    def blocks_of(self, district_id):
+        return self._children(self.blocks, self._block_slices, district_id)
+
+    def grampanchayats_of(self, block_id):
+        return self._children(self.grampanchayats, self._gp_slices, block_id)
+
+    def _bundle_payload(self, division_id):
+        if division_id is None:
+            districts, blocks, grampanchayats = self.districts, self.blocks, self.grampanchayats
+            divisions = self.divisions
+        else:
+            division = self.division_by_id.get(division_id)
+            divisions = (division,) if division else ()
+            districts = self.districts_of(division_id)
+            blocks = [b for d in districts for b in self.blocks_of(d[0])]
+            grampanchayats = [g for b in blocks for g in self.grampanchayats_of(b[0])]
+        return {
+            'divisions': divisions,
+            'districts': districts,
+            'blocks': blocks,
+            'grampanchayats': grampanchayats,
+        }
+
+    def bundle(self, division_id=None):
+        """Whole hierarchy (or one division's subtree) as compact JSON, pre-compressed.
+
+        Returns a dict with the content hash `etag` and the body under each
+        available encoding ('identity', 'gzip' and, if installed, 'br').
+        Built by warm() before the snapshot is swapped in, then served from
+        memory.
+        """
+        key = division_id
+        cached = self._bundles.get(key)
+        if cached is not None:
+            return cached
+        with self._bundles_lock:
+            cached = self._bundles.get(key)
+            if cached is not None:
+                return cached
+            body = json.dumps(self._bundle_payload(division_id), separators=(',', ':'),
+                              ensure_ascii=False).encode('utf-8')
+            cached = {
+                'etag': hashlib.sha1(body).hexdigest()[:20],
+                'identity': body,
+                'gzip': gzip.compress(body, compresslevel=9),
+            }
+            if brotli is not None:
+                cached['br'] = brotli.compress(body, quality=11)
+            self._bundles[key] = cached
+            return cached
+
+    def warm(self):
+        """Build every bundle and the typeahead keys up front so no request waits on them"""
+        self.bundle()
+        for division in self.divisions:
+            self.bundle(division[0])
+        self._gp_search_keys()
+
+    def resolve_selection(self, division_id, district_id, block_id, grampanchayat_ids):
+        """Resolve submitted ids to names and check they form one branch of the hierarchy.
+
+        Returns a dict with 'ok' and, on failure, a user-facing 'message';
+        on success also the division/district/block names and the GP names
+        and LGD codes ordered by LGD code.
+        """
+        try:
+            codes = [int(code) for code in grampanchayat_ids]
+        except (TypeError, ValueError):
+            codes = None
+        if not codes or len(set(codes)) != len(codes) or any(c not in self.gp_by_code for c in codes):
+            return {'ok': False, 'message': 'One or more selected grampanchayats not found'}
+
+        def lookup(rows_by_id, value):
+            try:
+                return rows_by_id.get(int(value))
+            except (TypeError, ValueError):
+                return None
+
+        division = lookup(self.division_by_id, division_id)
+        if not division:
+            return {'ok': False, 'message': 'Division not found'}
+        district = lookup(self.district_by_id, district_id)
+        if not district:
+            return {'ok': False, 'message': 'District not found'}
+        block = lookup(self.block_by_id, block_id)
+        if not block:
+            return {'ok': False, 'message': 'Block not found'}
+
+        if district[2] != division[0]:
+            return {'ok': False, 'message': 'Selected district does not belong to the selected division'}
+        if block[2] != district[0]:
+            return {'ok': False, 'message': 'Selected block does not belong to the selected district'}
+        gps = sorted(self.gp_by_code[c] for c in codes)
+        if any(gp[2] != block[0] for gp in gps):
+            return {'ok': False, 'message': 'Selected grampanchayats do not belong to the selected block'}
+
+        return {
+            'ok': True,
+            'division': division[1],
+            'district': district[1],
+            'block': block[1],
+            'grampanchayat_names': [gp[1] for gp in gps],
+            'lgd_codes': [str(gp[0]) for gp in gps],
+        }
+
+    def ancestors_of_gp(self, lgd_code):
+        """(block_id, district_id, division_id) for a GP, or None if unknown"""
+        gp = self.gp_by_code.get(lgd_code)
+        if gp is None:
+            return None
+        district_id = self.block_by_id[gp[2]][2]
+        return gp[2], district_id, self.district_by_id[district_id][2]
+
+    def gp_total(self, level, node_id):
+        """Number of grampanchayats under a node ('division', 'district', 'block' or 'gp')"""
+        if level == 'gp':
+            return 1 if node_id in self.gp_by_code else 0
+        if level == 'block':
+            return len(self.grampanchayats_of(node_id))
+        if level == 'district':
+            return sum(self.gp_total('block', b[0]) for b in self.blocks_of(node_id))
+        if level == 'division':
+            return sum(self.gp_total('district', d[0]) for d in self.districts_of(node_id))
+        raise ValueError(f"Unknown level {level!r}")
+
+    def _gp_search_keys(self):
+        """Sorted (key, LGD code) lists for the typeahead, built once per snapshot by warm().
+
+        One list is keyed by the whole name, the other by each later word
+        ("Budruk" in "Pimpri Budruk").
+        """
+        if self._gp_keys is not None:
+            return self._gp_keys
+        with self._gp_keys_lock:
+            if self._gp_keys is None:
+                name_keys, word_keys = [], []
+                for gp in self.grampanchayats:
+                    words = _key_words(gp[1])
+                    name_keys.append((''.join(words), gp[0]))
+                    for i in range(1, len(words)):
+                        word_keys.append((''.join(words[i:]), gp[0]))
+                self._gp_keys = (sorted(name_keys), sorted(word_keys))
+            return self._gp_keys
+
+    def search_grampanchayats(self, query, limit=10):
+        """GPs whose name (or a later word of it) starts with `query`, with their whole branch.
+
+        Matching ignores case, accents, spaces and common spelling variants
+        (see SPELLING_RULES). Whole-name matches come first; within each group
+        shorter names rank first. Each lookup is a few binary searches over
+        presorted keys.
+        """
+        prefixes = prefix_keys(query)
+        if not prefixes:
+            return []
+        scan = max(limit * 5, 50)
+        codes = []
+        for keys in self._gp_search_keys():
+            matches = {}
+            for prefix in prefixes:
+                i = bisect_left(keys, (prefix,))
+                stop = min(len(keys), i + scan)
+                while i < stop and keys[i][0].startswith(prefix):
+                    matches.setdefault(keys[i][1], keys[i][0])
+                    i += 1
+            for code in sorted(matches, key=lambda code: (len(matches[code]), matches[code], code)):
+                if len(codes) == limit:
+                    break
+                if code not in codes:
+                    codes.append(code)
+
+        results = []
+        for code in codes:
+            gp = self.gp_by_code[code]
+            block = self.block_by_id[gp[2]]
+            district = self.district_by_id[block[2]]
+            division = self.division_by_id[district[2]]
+            results.append({
+                'lgd_code': gp[0],
+                'name': gp[1],
+                'block_id': block[0],
+                'block': block[1],
+                'district_id': district[0],
+                'district': district[1],
+                'division_id': division[0],
+                'division': division[1],
+            })
+        return results
+
+    def counts(self):
+        return {
+            'divisions': len(self.divisions),
+            'districts': len(self.districts),
+            'blocks': len(self.blocks),
+            'grampanchayats': len(self.grampanchayats),
+        }
+
+
+_snapshot = None
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_last_version_check = 0.0
+
+
+def _read_version(cursor):
+    cursor.execute("SELECT version FROM reference_data_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def load():
+    """Read the four reference tables in one connection and swap in a new, warmed snapshot.
+
+    Called by warm_caches (in the gunicorn master, so workers inherit the
+    bundles and typeahead keys), reload() and the periodic version check.
+    """
+    global _snapshot, _last_version_check
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        version = _read_version(cursor)
+        cursor.execute("SELECT id, name FROM divisions")
+        divisions = cursor.fetchall()
+        cursor.execute("SELECT id, name, division_id FROM districts")
+        districts = cursor.fetchall()
+        cursor.execute("SELECT id, name, district_id FROM blocks")
+        blocks = cursor.fetchall()
+        cursor.execute("SELECT LGD_Code, name, block_id FROM grampanchayats")
+        grampanchayats = cursor.fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    snapshot = GeoSnapshot(divisions, districts, blocks, grampanchayats, version)
+    # Requests keep getting the old snapshot while this one compresses
+    snapshot.warm()
+    with _lock:
+        _snapshot = snapshot
+        _last_version_check = time.monotonic()
+    return snapshot
+
+
+def _maybe_refresh():
+    """Reload when another process has bumped reference_data_version.
+
+    The check is a single-row primary key read and runs at most once every
+    GEO_CACHE_CHECK_SECONDS per process.
+    """
+    global _last_version_check
+    interval = float(os.getenv('GEO_CACHE_CHECK_SECONDS', 60))
+    if interval <= 0 or time.monotonic() - _last_version_check < interval:
+        return
+    with _lock:
+        if time.monotonic() - _last_version_check < interval:
+            return
+        _last_version_check = time.monotonic()
+    try:
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            version = _read_version(cursor)
+            cursor.close()
+        finally:
+            connection.close()
+        if version != _snapshot.version:
+            load()
+    except Exception:
+        # Keep serving the current snapshot; the next check will retry
+        log.exception("Error checking geography version")
+
+
+def get():
+    """Return the current snapshot, loading it on first use"""
+    if _snapshot is None:
+        with _load_lock:
+            if _snapshot is None:
+                load()
+    else:
+        _maybe_refresh()
+    return _snapshot
+
+
+def bump_version(cursor):
+    """Mark the reference tables as changed so every process reloads its cache.
+
+    Call inside the transaction that modifies the tables.
+    """
+    cursor.execute(
+        "INSERT INTO reference_data_version (id, version) VALUES (1, 1) "
+        "ON DUPLICATE KEY UPDATE version = version + 1")
+
+
+def reload():
+    """Bump the shared version and reload this process's snapshot immediately"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        bump_version(cursor)
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return load()
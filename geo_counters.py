@@ -0,0 +1,199 @@
+"""Materialized VLE counters per division, district, block and grampanchayat.
+
+geo_counters holds, per node, the number of individual and cluster VLEs
+assigned to at least one GP under it and the number of its GPs that have a
+VLE; geo_daily_enrollments holds new VLEs per node and day. submit_form and
+update_record adjust them in their own transaction (apply), so dashboards
+read a few primary-key rows instead of grouping vle_details. rebuild()
+recomputes both tables from vle_grampanchayats for reconciliation.
+"""
+from collections import defaultdict
+
+import geo_cache
+from assignments import assignment_rows
+from db import get_db_connection
+
+
+# Level name -> vle_grampanchayats column; rows are always written in this
+# order (then by node id) so concurrent transactions lock them in one order
+LEVELS = (
+    ('gp', 'lgd_code'),
+    ('block', 'block_id'),
+    ('district', 'district_id'),
+    ('division', 'division_id'),
+)
+LEVEL_RANK = {level: rank for rank, (level, _) in enumerate(LEVELS)}
+VLE_TYPES = ('individual', 'cluster')
+
+UPSERT_COUNTERS = (
+    "INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered) "
+    "VALUES (%s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE individual_vles = individual_vles + VALUES(individual_vles), "
+    "cluster_vles = cluster_vles + VALUES(cluster_vles), "
+    "gps_covered = gps_covered + VALUES(gps_covered)"
+)
+UPSERT_ENROLLMENTS = (
+    "INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments) "
+    "VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE enrollments = enrollments + VALUES(enrollments)"
+)
+
+
+def parse_lgd_codes(text):
+    """LGD codes from the comma-joined vle_details.lgd_code text"""
+    return [code.strip() for code in str(text or '').split(',') if code.strip().isdigit()]
+
+
+def _nodes(lgd_codes, snapshot):
+    """{(level, node_id): ancestors} for every node a VLE with these GPs counts towards.
+
+    GP nodes map to their (block, district, division) nodes; the others to ().
+    """
+    nodes = {}
+    for _, code, block_id, district_id, division_id in assignment_rows(0, lgd_codes, snapshot):
+        parents = (('block', block_id), ('district', district_id), ('division', division_id))
+        nodes[('gp', code)] = parents
+        for parent in parents:
+            nodes[parent] = ()
+    return nodes
+
+
+def _ordered(deltas):
+    return sorted(
+        ((node, delta) for node, delta in deltas.items() if any(delta)),
+        key=lambda item: (LEVEL_RANK[item[0][0]], item[0][1]))
+
+
+def apply(cursor, before, after, enrolled_on=None):
+    """Adjust the counters for one VLE, inside the caller's transaction (dictionary cursor).
+
+    `before` and `after` are (vle_type, lgd_codes) or None: (None, new) for a
+    new VLE, (old, new) for an update. `enrolled_on` is the VLE's creation
+    date (None means today); an update that moves the VLE moves its
+    enrollment to the new nodes on that day.
+    """
+    snapshot = geo_cache.get()
+    old_nodes = _nodes(before[1], snapshot) if before else {}
+    new_nodes = _nodes(after[1], snapshot) if after else {}
+
+    # [individual, cluster, gps_covered] per node
+    deltas = defaultdict(lambda: [0, 0, 0])
+    if before:
+        for node in old_nodes:
+            deltas[node][VLE_TYPES.index(before[0])] -= 1
+    if after:
+        for node in new_nodes:
+            deltas[node][VLE_TYPES.index(after[0])] += 1
+
+    gp_rows = [(node, delta) for node, delta in _ordered(deltas) if node[0] == 'gp']
+    if gp_rows:
+        cursor.executemany(UPSERT_COUNTERS, [(*node, *delta) for node, delta in gp_rows])
+        # The upsert holds these rows' locks, so this reads their current totals
+        codes = [node[1] for node, _ in gp_rows]
+        cursor.execute(
+            "SELECT node_id, individual_vles + cluster_vles AS vles, gps_covered FROM geo_counters "
+            f"WHERE level = 'gp' AND node_id IN ({', '.join(['%s'] * len(codes))}) FOR UPDATE",
+            codes)
+        flipped = []
+        for row in cursor.fetchall():
+            change = (1 if row['vles'] > 0 else 0) - row['gps_covered']
+            if change:
+                flipped.append((change, row['node_id']))
+                parents = old_nodes.get(('gp', row['node_id'])) or new_nodes[('gp', row['node_id'])]
+                for parent in parents:
+                    deltas[parent][2] += change
+        for change, code in flipped:
+            cursor.execute(
+                "UPDATE geo_counters SET gps_covered = gps_covered + %s WHERE level = 'gp' AND node_id = %s",
+                (change, code))
+
+    parent_rows = [(node, delta) for node, delta in _ordered(deltas) if node[0] != 'gp']
+    if parent_rows:
+        cursor.executemany(UPSERT_COUNTERS, [(*node, *delta) for node, delta in parent_rows])
+
+    moved = set(old_nodes) ^ set(new_nodes)
+    enrollments = [
+        (level, node_id, enrolled_on, 1 if (level, node_id) in new_nodes else -1)
+        for level, node_id in sorted(moved, key=lambda node: (LEVEL_RANK[node[0]], node[1]))
+    ]
+    if enrollments:
+        if enrolled_on is None:
+            # The database's date, as rebuild() uses DATE(created_at)
+            cursor.execute("SELECT CURDATE() AS today")
+            enrolled_on = cursor.fetchone()['today']
+        cursor.executemany(UPSERT_ENROLLMENTS, [(*row[:2], enrolled_on, row[3]) for row in enrollments])
+
+
+def rebuild(cursor):
+    """Recompute both counter tables from vle_grampanchayats, inside the caller's transaction"""
+    cursor.execute("DELETE FROM geo_counters")
+    cursor.execute("DELETE FROM geo_daily_enrollments")
+    for level, column in LEVELS:
+        cursor.execute(f"""
+            INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered)
+            SELECT %s, a.{column},
+                   COUNT(DISTINCT CASE WHEN v.vle_type = 'individual' THEN v.id END),
+                   COUNT(DISTINCT CASE WHEN v.vle_type = 'cluster' THEN v.id END),
+                   COUNT(DISTINCT a.lgd_code)
+            FROM vle_grampanchayats a
+            JOIN vle_details v ON v.id = a.vle_id
+            GROUP BY a.{column}
+        """, (level,))
+        cursor.execute(f"""
+            INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments)
+            SELECT %s, a.{column}, DATE(v.created_at), COUNT(DISTINCT v.id)
+            FROM vle_grampanchayats a
+            JOIN vle_details v ON v.id = a.vle_id
+            GROUP BY a.{column}, DATE(v.created_at)
+        """, (level,))
+
+
+def reconcile():
+    """Run rebuild() in its own transaction; returns the number of counter rows written"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        rebuild(cursor)
+        cursor.execute("SELECT COUNT(*) FROM geo_counters")
+        rows = cursor.fetchone()[0]
+        connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return rows
+
+
+def read_counters(cursor, level, node_ids):
+    """{node_id: {individual_vles, cluster_vles, gps_covered}} for the nodes that have counters"""
+    if not node_ids:
+        return {}
+    cursor.execute(
+        "SELECT node_id, individual_vles, cluster_vles, gps_covered FROM geo_counters "
+        f"WHERE level = %s AND node_id IN ({', '.join(['%s'] * len(node_ids))})",
+        (level, *node_ids))
+    return {
+        row['node_id']: {
+            'individual_vles': row['individual_vles'],
+            'cluster_vles': row['cluster_vles'],
+            'gps_covered': row['gps_covered'],
+        }
+        for row in cursor.fetchall()
+    }
+
+
+def read_enrollments(cursor, level, node_id, days):
+    """[{day, enrollments}] for the last `days` days, only days with enrollments.
+
+    node_id None sums every node of `level` (the whole state for 'division').
+    """
+    where, params = "level = %s", [level]
+    if node_id is not None:
+        where, params = "level = %s AND node_id = %s", [level, node_id]
+    cursor.execute(
+        f"SELECT day, SUM(enrollments) AS enrollments FROM geo_daily_enrollments "
+        f"WHERE {where} AND day > CURDATE() - INTERVAL %s DAY GROUP BY day ORDER BY day",
+        (*params, days))
+    return [{'day': str(row['day']), 'enrollments': int(row['enrollments'])} for row in cursor.fetchall()]
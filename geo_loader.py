@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+import time
+
+import geo_cache
+import geo_counters
+from db import get_db_connection
+
+
+# Load order (parents first); each entry: table, CSV file, key column, CSV columns -> table columns
+TABLES = [
+    ('divisions', 'Divisions.csv', 'id', [('ID', 'id'), ('Name', 'name')], None),
+    ('districts', 'Districts.csv', 'id', [('ID', 'id'), ('Name', 'name'), ('Division_ID', 'division_id')],
+     'divisions'),
+    ('blocks', 'Blocks.csv', 'id', [('ID', 'id'), ('Name', 'name'), ('District_ID', 'district_id')],
+     'districts'),
+    ('grampanchayats', 'GP.csv', 'LGD_Code', [('LGD_Code', 'LGD_Code'), ('Name', 'name'), ('Block_ID', 'block_id')],
+     'blocks'),
+]
+
+BATCH_SIZE = 2000
+
+
+def _read_csv(path):
+    """Rows of a reference CSV as dicts.
+
+    The files are UTF-8 but a few lines carry stray Windows-1252 bytes;
+    those lines are decoded as cp1252 instead of failing the whole load.
+    Returns (rows, number_of_lines_decoded_as_cp1252).
+    """
+    fallback = 0
+    lines = []
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                lines.append(raw.decode('utf-8'))
+            except UnicodeDecodeError:
+                lines.append(raw.decode('cp1252', 'replace'))
+                fallback += 1
+    text = ''.join(lines).lstrip('﻿')
+    return list(csv.DictReader(io.StringIO(text))), fallback
+
+
+def read_reference_files(directory):
+    """Parse and check the four CSVs; returns {table: {key: row_tuple}}.
+
+    Raises ValueError on duplicate keys or rows whose parent is missing.
+    """
+    data = {}
+    for table, filename, key, columns, parent in TABLES:
+        rows, fallback = _read_csv(os.path.join(directory, filename))
+        if fallback:
+            print(f"{filename}: {fallback} line(s) were not valid UTF-8 and were read as cp1252")
+        parsed = {}
+        for line_number, row in enumerate(rows, 2):
+            try:
+                values = tuple(int(row[src]) if dst != 'name' else row[src].strip() for src, dst in columns)
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"{filename}:{line_number}: malformed row {row}")
+            if values[0] in parsed:
+                raise ValueError(f"{filename}:{line_number}: duplicate {key} {values[0]}")
+            if parent and values[2] not in data[parent]:
+                raise ValueError(f"{filename}:{line_number}: unknown parent id {values[2]}")
+            parsed[values[0]] = values
+        data[table] = parsed
+    return data
+
+
+def _current_rows(cursor, table, columns):
+    cursor.execute(f"SELECT {', '.join(dst for _, dst in columns)} FROM {table}")
+    return {row[0]: tuple(row) for row in cursor.fetchall()}
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def load(directory, dry_run=False):
+    """Bring the reference tables in line with the CSVs, touching only rows that differ.
+
+    All changes go in one transaction (batched multi-row statements): upserts
+    parents-first, deletes children-first. If anything changed, the assignment
+    table's denormalized block/district/division ids are refreshed and the
+    reference version is bumped so every app process reloads its cache.
+    Returns {table: {'insert': n, 'update': n, 'delete': n}}.
+    """
+    started = time.monotonic()
+    wanted = read_reference_files(directory)
+
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        plan = {}
+        for table, _, key, columns, _ in TABLES:
+            current = _current_rows(cursor, table, columns)
+            target = wanted[table]
+            plan[table] = {
+                'upsert': [row for k, row in target.items() if current.get(k) != row],
+                'insert': sum(1 for k in target if k not in current),
+                'delete': [k for k in current if k not in target],
+                'moved': any(k in current and current[k][2:] != row[2:] for k, row in target.items()),
+            }
+
+        summary = {
+            table: {
+                'insert': p['insert'],
+                'update': len(p['upsert']) - p['insert'],
+                'delete': len(p['delete']),
+            }
+            for table, p in plan.items()
+        }
+        changed = any(sum(counts.values()) for counts in summary.values())
+
+        if changed and not dry_run:
+            for table, _, key, columns, _ in TABLES:
+                names = [dst for _, dst in columns]
+                query = (
+                    f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))}) "
+                    f"ON DUPLICATE KEY UPDATE {', '.join(f'{n} = VALUES({n})' for n in names[1:])}"
+                )
+                for chunk in _chunks(plan[table]['upsert']):
+                    cursor.executemany(query, chunk)
+
+            for table, _, key, _, _ in reversed(TABLES):
+                for chunk in _chunks(plan[table]['delete']):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE {key} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+            if any(p['moved'] for p in plan.values()):
+                # A GP, block or district changed parent: re-derive the copied ancestor ids
+                # and the per-node counters built from them
+                cursor.execute("""
+                    UPDATE vle_grampanchayats a
+                    JOIN grampanchayats g ON g.LGD_Code = a.lgd_code
+                    JOIN blocks b ON b.id = g.block_id
+                    JOIN districts d ON d.id = b.district_id
+                    SET a.block_id = g.block_id,
+                        a.district_id = b.district_id,
+                        a.division_id = d.division_id
+                """)
+                geo_counters.rebuild(cursor)
+
+            geo_cache.bump_version(cursor)
+            connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    elapsed = time.monotonic() - started
+    for table, counts in summary.items():
+        print(f"{table:<15} +{counts['insert']:<6} ~{counts['update']:<6} -{counts['delete']:<6}")
+    if dry_run:
+        print(f"Dry run, nothing written ({elapsed:.2f}s)")
+    elif changed:
+        print(f"Applied in {elapsed:.2f}s; geography version bumped")
+    else:
+        print(f"Already up to date ({elapsed:.2f}s)")
+    return summary
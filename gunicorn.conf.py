@@ -0,0 +1,119 @@
+"""gunicorn settings for production (`gunicorn -c gunicorn.conf.py app:app`).
+
+The app is imported once in the master (preload_app). Importing it compiles
+the email templates, and warm_caches() builds the geography snapshot with its
+compressed bundles and typeahead keys (geo_cache.load) and the identifier and
+name search indexes, so forked workers start with all of them instead of
+building their own. Pages are shared copy-on-write until a worker
+touches them. A geography reload after fork (reload-geography or a version
+change) rebuilds the snapshot in each worker separately. Database
+connections opened while preloading are closed before forking; each worker
+opens its own pool on first use.
+
+GUNICORN_MODE picks the worker class:
+
+  gthread (default)  WEB_CONCURRENCY processes x GUNICORN_THREADS threads.
+                     Slow SMTP or MySQL calls tie up one thread, not a process.
+                     Keep threads <= DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW.
+  gevent             One process per core, up to GUNICORN_WORKER_CONNECTIONS
+                     greenlets each. Needs `pip install gevent`; the config
+                     monkey-patches before the app is preloaded and switches
+                     mysql-connector to its pure-Python driver so queries
+                     yield instead of blocking the process. The DB pool, not
+                     the greenlet count, then caps concurrent queries.
+  sync               One request per process (gunicorn's default), for
+                     comparison only.
+
+Every worker holds its own DB pool, so the instance can open up to
+workers x (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) MySQL connections; keep that
+under the server's max_connections.
+
+Benchmarks: the three modes have never been measured against each other;
+the gthread default is a judgement call, not a measured result, and there
+are no req/s or p95 figures for any mode. To compare them, run each mode on
+the target instance size against the same MySQL and SMTP setup, e.g.
+
+    GUNICORN_MODE=gthread gunicorn -c gunicorn.conf.py app:app
+    python bench/loadtest.py --users 50 --duration 120 --json gthread.json
+
+and record throughput and p95 per route for each mode here before changing
+the defaults.
+"""
+import os
+
+mode = os.getenv('GUNICORN_MODE', 'gthread')
+
+if mode == 'gevent':
+    # Patch before the app is preloaded: module-level threading.local() objects
+    # (per-request metrics, log request ids) must be greenlet-local, not shared
+    # by every greenlet of a worker's one OS thread
+    from gevent import monkey
+    monkey.patch_all()
+
+import glob  # noqa: E402
+import multiprocessing  # noqa: E402
+import tempfile  # noqa: E402
+
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+preload_app = True
+
+if mode == 'gevent':
+    worker_class = 'gevent'
+    workers = int(os.getenv('WEB_CONCURRENCY', cores))
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+    os.environ.setdefault('DB_USE_PURE', '1')
+elif mode == 'sync':
+    worker_class = 'sync'
+    workers = int(os.getenv('WEB_CONCURRENCY', cores * 2 + 1))
+else:
+    worker_class = 'gthread'
+    workers = int(os.getenv('WEB_CONCURRENCY', max(2, cores)))
+    threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# A request stuck longer than this gets its worker restarted; SMTP sends run
+# in the outbox threads, so requests themselves only wait on MySQL
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then (staggered) to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# The app writes its own sampled JSON access log (structured_log.py); set
+# GUNICORN_ACCESS_LOG=- to get gunicorn's unsampled one as well
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# Workers write metric snapshots here so /metrics can sum them (see metrics.py)
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'mh-vle-metrics'))
+
+
+def on_starting(server):
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def pre_fork(server, worker):
+    # Don't let workers inherit sockets the master opened while preloading
+    import db
+    db.dispose()
+
+
+def worker_exit(server, worker):
+    # Let in-flight confirmation emails finish; unfinished leases are retried later anyway
+    import outbox
+    import metrics
+    outbox.stop_workers(timeout=min(graceful_timeout, 10))
+    metrics.maybe_flush(force=True)
+
+
+def child_exit(server, worker):
+    # Runs in the master for every exited worker, including ones killed on
+    # timeout, so METRICS_DIR keeps one file per live worker
+    import metrics
+    metrics.retire(worker.pid)
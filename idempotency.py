@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import mysql.connector
+
+from db import get_db_connection
+
+log = logging.getLogger(__name__)
+
+
+# Client-generated keys (the form sends a UUID); results are kept for TTL_SECONDS
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{8,64}')
+TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 2048))
+PURGE_INTERVAL = 600
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_last_purge = {'at': 0.0}
+
+
+class KeyInUse(Exception):
+    """Another request committed (or is committing) a result for the same key"""
+
+
+def valid_key(key):
+    return bool(key) and KEY_PATTERN.fullmatch(key) is not None
+
+
+def _remember(key, result):
+    with _lock:
+        _cache[key] = (time.monotonic() + TTL_SECONDS, result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def lookup(key):
+    """(status_code, body) stored for `key`, or None if it hasn't completed.
+
+    Checks this process's cache first, then the idempotency_keys table.
+    """
+    with _lock:
+        hit = _cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+
+    _maybe_purge()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT status_code, response FROM idempotency_keys "
+            "WHERE idem_key = %s AND created_at >= NOW() - INTERVAL %s SECOND",
+            (key, TTL_SECONDS))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    body = row[1]
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode('utf-8')
+    result = (row[0], json.loads(body) if isinstance(body, str) else body)
+    _remember(key, result)
+    return result
+
+
+def claim(cursor, key, status_code, body):
+    """Record the response for `key` inside the caller's transaction.
+
+    Call it before the transaction's other writes: a concurrent request with
+    the same key blocks here until the first one commits and then gets
+    KeyInUse (or proceeds normally if the first one rolled back).
+
+    A single INSERT, with no DELETE of an expired row first: that DELETE's
+    gap lock made two simultaneous requests with a new key deadlock. Keys
+    are per-submission UUIDs and expired rows are purged by _maybe_purge.
+    If MySQL still reports a deadlock (1213), which rolls back the caller's
+    transaction, the key is treated as in use as well.
+    """
+    try:
+        cursor.execute(
+            "INSERT INTO idempotency_keys (idem_key, status_code, response) VALUES (%s, %s, %s)",
+            (key, status_code, json.dumps(body)))
+    except mysql.connector.Error as err:
+        if err.errno in (1062, 1213):
+            raise KeyInUse(key)
+        raise
+
+
+def completed(key, status_code, body):
+    """Cache a committed result locally so replays to this process skip the database"""
+    _remember(key, (status_code, body))
+
+
+def _maybe_purge():
+    now = time.monotonic()
+    if now - _last_purge['at'] < PURGE_INTERVAL:
+        return
+    _last_purge['at'] = now
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "DELETE FROM idempotency_keys WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 5000",
+            (TTL_SECONDS,))
+        connection.commit()
+        cursor.close()
+    except mysql.connector.Error:
+        log.exception("Error purging idempotency keys")
+    finally:
+        connection.close()
@@ -0,0 +1,74 @@
+import threading
+
+from db import get_db_connection
+from vle_sync import VleSync
+
+
+# Identifier columns the form can pre-check; values are stored normalized
+FIELDS = ('csc_id', 'aadhar_number', 'contact_number')
+
+_sets = {field: set() for field in FIELDS}
+_lock = threading.Lock()
+_stats = {'checks': 0, 'probable_hits': 0, 'confirmed': 0}
+
+
+def _apply(rows):
+    with _lock:
+        for row in rows:
+            for field, value in zip(FIELDS, row):
+                if value:
+                    _sets[field].add(value)
+
+
+# Picks up rows written by other processes, at most every IDENTIFIER_SYNC_SECONDS
+_sync = VleSync('identifier index', FIELDS, _apply, 'IDENTIFIER_SYNC_SECONDS', 5)
+
+
+def load():
+    """Read every stored identifier into memory (startup warm-up)"""
+    _sync.load()
+
+
+def add(record):
+    """Add a just-committed vle_details row's identifiers (dict keyed by column)"""
+    with _lock:
+        for field in FIELDS:
+            if record.get(field):
+                _sets[field].add(record[field])
+
+
+def is_registered(field, value, exclude_csc_id=None):
+    """True if a VLE other than `exclude_csc_id` already uses this identifier.
+
+    Answered from memory when the value is unknown; only a hit (which can be
+    stale after an edit changed the identifier) is confirmed in MySQL.
+    """
+    _sync.sync()
+    with _lock:
+        _stats['checks'] += 1
+        if value not in _sets[field]:
+            return False
+        _stats['probable_hits'] += 1
+
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT csc_id FROM vle_details WHERE {field} = %s LIMIT 2", (value,))
+        owners = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        connection.close()
+    registered = any(owner != exclude_csc_id for owner in owners)
+    if registered:
+        with _lock:
+            _stats['confirmed'] += 1
+    return registered
+
+
+def stats():
+    with _lock:
+        return {
+            **_stats,
+            **_sync.stats(),
+            'sizes': {field: len(values) for field, values in _sets.items()},
+        }
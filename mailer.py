@@ -0,0 +1,184 @@
+import os
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+
+
+# Errors after which the session is thrown away and the message retried on a fresh one
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError)
+
+
+class SMTPRelay:
+    """Keeps authenticated SMTP sessions to one relay alive and reuses them.
+
+    At most `max_sessions` sessions are open at once (callers block for a
+    free slot), a session is retired after `max_messages` messages, and one
+    that sat idle longer than `idle_seconds` is checked with NOOP before reuse.
+    Disconnects, timeouts and 4xx replies close the session and the message
+    is retried once on a new one; 5xx replies are raised to the caller.
+    """
+
+    def __init__(self, host, port=587, username=None, password=None, starttls=True,
+                 timeout=30.0, max_sessions=4, max_messages=100, idle_seconds=60.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._stats = {'sessions_opened': 0, 'messages': 0, 'reconnects': 0, 'noop_failures': 0}
+
+    def _open(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        with self._lock:
+            self._stats['sessions_opened'] += 1
+        return [server, 0, time.monotonic()]
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return self._open()
+            server, sent, last_used = session
+            if time.monotonic() - last_used < self.idle_seconds:
+                return session
+            try:
+                if server.noop()[0] == 250:
+                    return session
+            except Exception:
+                pass
+            with self._lock:
+                self._stats['noop_failures'] += 1
+            self._close(server)
+
+    def _checkin(self, session):
+        if session[1] >= self.max_messages:
+            self._close(session[0])
+            return
+        session[2] = time.monotonic()
+        with self._lock:
+            self._idle.append(session)
+
+    def _deliver(self, session, from_addr, to_addrs, message):
+        session[0].sendmail(from_addr, to_addrs, message)
+        session[1] += 1
+        with self._lock:
+            self._stats['messages'] += 1
+
+    def send_many(self, messages):
+        """Send (from_addr, to_addrs, message) tuples over one session.
+
+        Returns a list with None for each delivered message and the exception
+        for each failed one, in input order.
+        """
+        results = []
+        self._slots.acquire()
+        session = None
+        try:
+            for from_addr, to_addrs, message in messages:
+                for attempt in (1, 2):
+                    try:
+                        if session is None:
+                            session = self._checkout()
+                        self._deliver(session, from_addr, to_addrs, message)
+                        results.append(None)
+                        break
+                    except Exception as e:
+                        transient = isinstance(e, RECONNECT_ERRORS) or (
+                            isinstance(e, smtplib.SMTPResponseException) and 400 <= e.smtp_code < 500)
+                        protocol_error = isinstance(
+                            e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+                        # smtplib resets the transaction on 5xx replies, so only then is the session still usable
+                        if session is not None and (transient or not protocol_error):
+                            self._close(session[0])
+                            session = None
+                        if transient and attempt == 1:
+                            with self._lock:
+                                self._stats['reconnects'] += 1
+                            continue
+                        results.append(e)
+                        break
+                if session is not None and session[1] >= self.max_messages:
+                    self._close(session[0])
+                    session = None
+        finally:
+            if session is not None:
+                self._checkin(session)
+            self._slots.release()
+        return results
+
+    def send(self, from_addr, to_addrs, message):
+        error = self.send_many([(from_addr, to_addrs, message)])[0]
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self._lock:
+            sessions, self._idle = list(self._idle), deque()
+        for server, _, _ in sessions:
+            self._close(server)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'idle_sessions': len(self._idle)}
+
+
+_relays = {}
+_relays_lock = threading.Lock()
+
+
+def get_relay():
+    """Process-wide relay for the configured SMTP server (one per host/port/user)"""
+    host = os.getenv('SMTP_SERVER')
+    port = int(os.getenv('SMTP_PORT', 587))
+    username = os.getenv('SMTP_USERNAME')
+    key = (host, port, username, os.getpid())
+    relay = _relays.get(key)
+    if relay is None:
+        with _relays_lock:
+            relay = _relays.get(key)
+            if relay is None:
+                relay = SMTPRelay(
+                    host, port,
+                    username=username,
+                    password=os.getenv('SMTP_PASSWORD'),
+                    starttls=os.getenv('SMTP_STARTTLS', '1') != '0',
+                    timeout=float(os.getenv('SMTP_TIMEOUT', 30)),
+                    max_sessions=int(os.getenv('SMTP_MAX_SESSIONS', 4)),
+                    max_messages=int(os.getenv('SMTP_MAX_MESSAGES_PER_SESSION', 100)),
+                    idle_seconds=float(os.getenv('SMTP_IDLE_SECONDS', 60)),
+                )
+                _relays[key] = relay
+    return relay
+
+
+def stats():
+    return {f"{host}:{port}": relay.stats() for (host, port, _, pid), relay in _relays.items()
+            if pid == os.getpid()}
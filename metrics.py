@@ -0,0 +1,288 @@
+"""Request, database and email instrumentation rendered in Prometheus text format.
+
+Metrics live in this process. Under gunicorn every worker also writes a
+snapshot to METRICS_DIR (at most every FLUSH_SECONDS) and /metrics sums the
+snapshots of all workers. When a worker exits, the gunicorn master folds
+its last snapshot into one EXITED_FILE (retire), so the directory holds one
+file per live worker and counters never go backwards. Without METRICS_DIR
+only this process is reported.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+FLUSH_SECONDS = 5.0
+EXITED_FILE = 'exited.json'
+# How long a retired pid stays listed in EXITED_FILE, so a /metrics read that
+# raced the retire doesn't count that worker twice
+RETIRED_PID_SECONDS = 60
+
+_lock = threading.Lock()
+_metrics = {}
+_local = threading.local()
+_last_flush = {'at': 0.0}
+
+
+class Metric:
+    def __init__(self, kind, name, help_text, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.values = {}  # label values tuple -> float, or [bucket counts..., sum, count]
+        _metrics[name] = self
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def observe(self, value, *labels):
+        with _lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+
+def counter(name, help_text, labelnames=()):
+    return Metric('counter', name, help_text, labelnames)
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return Metric('histogram', name, help_text, labelnames, buckets)
+
+
+REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method'))
+REQUESTS = counter(
+    'http_requests_total', 'Requests by route and status', ('route', 'status'))
+ERRORS = counter(
+    'http_request_errors_total', 'Responses with status >= 400 or unhandled exceptions', ('route', 'status'))
+QUERIES_PER_REQUEST = histogram(
+    'db_queries_per_request', 'SQL statements executed per request', ('route',), COUNT_BUCKETS)
+DB_SECONDS_PER_REQUEST = histogram(
+    'db_time_per_request_seconds', 'Time spent executing SQL and fetching rows per request', ('route',))
+QUERY_SECONDS = histogram(
+    'db_query_duration_seconds', 'Time per SQL statement execute() call', buckets=FAST_BUCKETS)
+ACQUIRE_SECONDS = histogram(
+    'db_connection_acquire_seconds', 'Time to check out a pooled connection, including waits and connects',
+    buckets=FAST_BUCKETS)
+CONNECT_SECONDS = histogram(
+    'db_connect_seconds', 'Time to open a new MySQL connection', buckets=FAST_BUCKETS)
+EMAIL_RENDER_SECONDS = histogram(
+    'email_render_seconds', 'Time to render the confirmation email', buckets=FAST_BUCKETS)
+EMAIL_SEND_SECONDS = histogram(
+    'email_send_seconds', 'Time to hand the confirmation email to the SMTP relay')
+EMAIL_SEND_FAILURES = counter(
+    'email_send_failures_total', 'Confirmation emails the relay did not accept')
+
+
+class timed:
+    """Context manager observing the block's duration on a histogram"""
+
+    def __init__(self, metric, *labels):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metric.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def begin_request():
+    _local.queries = 0
+    _local.db_seconds = 0.0
+    _local.started = time.perf_counter()
+
+
+def record_query(seconds):
+    QUERY_SECONDS.observe(seconds)
+    if getattr(_local, 'started', None) is not None:
+        _local.queries += 1
+        _local.db_seconds += seconds
+
+
+def record_fetch(seconds):
+    if getattr(_local, 'started', None) is not None:
+        _local.db_seconds += seconds
+
+
+def current_request():
+    """(statements, seconds in MySQL) so far for the request on this thread"""
+    return getattr(_local, 'queries', 0), getattr(_local, 'db_seconds', 0.0)
+
+
+def end_request(route, method, status):
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return
+    _local.started = None
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route, method)
+    REQUESTS.inc(route, str(status))
+    if status >= 400:
+        ERRORS.inc(route, str(status))
+    QUERIES_PER_REQUEST.observe(_local.queries, route)
+    DB_SECONDS_PER_REQUEST.observe(_local.db_seconds, route)
+    maybe_flush()
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: [[list(labels), value if not isinstance(value, list) else list(value)]
+                   for labels, value in metric.values.items()]
+            for name, metric in _metrics.items()
+        }
+
+
+def maybe_flush(force=False):
+    """Write this process's snapshot to METRICS_DIR, at most every FLUSH_SECONDS"""
+    directory = os.getenv('METRICS_DIR')
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush['at'] < FLUSH_SECONDS):
+        return
+    _last_flush['at'] = now
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(_snapshot(), f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        log.exception("Error writing metrics snapshot")
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(totals, snapshot):
+    """Sum one snapshot ({name: [[labels, value], ...]}) into {name: {labels: value}}"""
+    for name, series in snapshot.items():
+        target = totals.setdefault(name, {})
+        for labels, value in series:
+            key = tuple(labels)
+            if isinstance(value, list):
+                current = target.setdefault(key, [0] * len(value))
+                for i, v in enumerate(value):
+                    current[i] += v
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def retire(pid):
+    """Fold an exited worker's snapshot into EXITED_FILE and delete its own file.
+
+    Called by the gunicorn master (child_exit), one worker at a time, after
+    the worker's final flush; workers killed before flushing lose at most
+    FLUSH_SECONDS of counts.
+    """
+    directory = os.getenv('METRICS_DIR')
+    if not directory:
+        return
+    path = os.path.join(directory, f"{pid}.json")
+    exited_path = os.path.join(directory, EXITED_FILE)
+    snapshot = _read(path)
+    if snapshot is None:
+        return
+    exited = _read(exited_path) or {'retired': [], 'metrics': {}}
+    totals = {}
+    _add(totals, exited['metrics'])
+    _add(totals, snapshot)
+    now = time.time()
+    retired = [[p, at] for p, at in exited['retired'] if now - at < RETIRED_PID_SECONDS]
+    retired.append([pid, now])
+    try:
+        with open(exited_path + '.tmp', 'w') as f:
+            json.dump({
+                'retired': retired,
+                'metrics': {
+                    name: [[list(labels), value] for labels, value in series.items()]
+                    for name, series in totals.items()
+                },
+            }, f)
+        os.replace(exited_path + '.tmp', exited_path)
+        os.remove(path)
+    except OSError:
+        log.exception("Error retiring metrics snapshot")
+
+
+def _merged():
+    """{name: {labels: value}} summed over every process snapshot in METRICS_DIR"""
+    directory = os.getenv('METRICS_DIR')
+    snapshots = {}
+    if directory:
+        maybe_flush(force=True)
+        for filename in os.listdir(directory):
+            stem, ext = os.path.splitext(filename)
+            if ext == '.json' and stem.isdigit():
+                snapshot = _read(os.path.join(directory, filename))
+                if snapshot is not None:
+                    snapshots[int(stem)] = snapshot
+        # Read after the worker files: a worker retired in between is then
+        # either still in `snapshots` and listed as retired here, or gone
+        # from `snapshots` and already in the totals
+        exited = _read(os.path.join(directory, EXITED_FILE))
+        if exited:
+            for pid, _ in exited['retired']:
+                snapshots.pop(pid, None)
+            snapshots['exited'] = exited['metrics']
+    else:
+        snapshots[os.getpid()] = _snapshot()
+
+    merged = {name: {} for name in _metrics}
+    for snapshot in snapshots.values():
+        _add(merged, {name: series for name, series in snapshot.items() if name in merged})
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, le=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, values in _merged().items():
+        metric = _metrics[name]
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(values.items()):
+            if metric.kind == 'counter':
+                lines.append(f"{name}{_label_text(metric.labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(metric.labelnames, labels, bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(metric.labelnames, labels, '+Inf')} {value[-1]}")
+            lines.append(f"{name}_sum{_label_text(metric.labelnames, labels)} {value[-2]}")
+            lines.append(f"{name}_count{_label_text(metric.labelnames, labels)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
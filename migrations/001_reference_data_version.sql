@@ -0,0 +1,8 @@
+-- Version counter for the geography reference tables (see geo_cache.py)
+CREATE TABLE IF NOT EXISTS reference_data_version (
+    id TINYINT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 1
+);
+
+INSERT INTO reference_data_version (id, version) VALUES (1, 1)
+    ON DUPLICATE KEY UPDATE version = version;
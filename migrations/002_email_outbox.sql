@@ -0,0 +1,14 @@
+-- Durable queue for confirmation emails (see outbox.py)
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    recipient VARCHAR(100) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'dead') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until DATETIME NULL,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    KEY idx_outbox_due (status, next_attempt_at)
+);
@@ -0,0 +1,12 @@
+-- Normalize stored identifiers the way the app now writes them (no spaces or dashes)
+-- and index them so search_record can use equality lookups instead of scanning.
+-- Check for rows that would collide on csc_id before running this on production.
+UPDATE vle_details
+SET csc_id = REPLACE(REPLACE(TRIM(csc_id), ' ', ''), '-', ''),
+    aadhar_number = REPLACE(REPLACE(TRIM(aadhar_number), ' ', ''), '-', ''),
+    contact_number = REPLACE(REPLACE(TRIM(contact_number), ' ', ''), '-', ''),
+    whatsapp_number = REPLACE(REPLACE(TRIM(whatsapp_number), ' ', ''), '-', '');
+
+ALTER TABLE vle_details
+    ADD KEY idx_vle_aadhar_number (aadhar_number),
+    ADD KEY idx_vle_contact_number (contact_number);
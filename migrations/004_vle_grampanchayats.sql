@@ -0,0 +1,10 @@
+-- VLE <-> grampanchayat assignments, indexed both ways.
+-- After creating the table run `flask backfill-assignments` once to fill it
+-- from the comma-joined vle_details.lgd_code values.
+CREATE TABLE IF NOT EXISTS vle_grampanchayats (
+    vle_id INT NOT NULL,
+    lgd_code INT NOT NULL,
+    PRIMARY KEY (vle_id, lgd_code),
+    KEY idx_vle_gp_lgd_code (lgd_code, vle_id),
+    FOREIGN KEY (vle_id) REFERENCES vle_details(id) ON DELETE CASCADE
+);
@@ -0,0 +1,22 @@
+-- Denormalize each assignment's block/district/division so the coverage API
+-- can answer "VLEs in district X" from a single index range.
+ALTER TABLE vle_grampanchayats
+    ADD COLUMN block_id INT NOT NULL DEFAULT 0,
+    ADD COLUMN district_id INT NOT NULL DEFAULT 0,
+    ADD COLUMN division_id INT NOT NULL DEFAULT 0;
+
+UPDATE vle_grampanchayats a
+JOIN grampanchayats g ON g.LGD_Code = a.lgd_code
+JOIN blocks b ON b.id = g.block_id
+JOIN districts d ON d.id = b.district_id
+SET a.block_id = g.block_id,
+    a.district_id = b.district_id,
+    a.division_id = d.division_id;
+
+ALTER TABLE vle_grampanchayats
+    ALTER COLUMN block_id DROP DEFAULT,
+    ALTER COLUMN district_id DROP DEFAULT,
+    ALTER COLUMN division_id DROP DEFAULT,
+    ADD KEY idx_vle_gp_block (block_id, vle_id, lgd_code),
+    ADD KEY idx_vle_gp_district (district_id, vle_id, lgd_code),
+    ADD KEY idx_vle_gp_division (division_id, vle_id, lgd_code);
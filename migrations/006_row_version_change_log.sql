@@ -0,0 +1,14 @@
+-- Optimistic concurrency for update_record and a compact log of what each edit changed
+ALTER TABLE vle_details
+    ADD COLUMN row_version INT NOT NULL DEFAULT 1,
+    ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS vle_change_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    vle_id INT NOT NULL,
+    row_version INT NOT NULL,
+    changes JSON NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_change_log_vle (vle_id, row_version),
+    FOREIGN KEY (vle_id) REFERENCES vle_details(id) ON DELETE CASCADE
+);
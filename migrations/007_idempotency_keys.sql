@@ -0,0 +1,8 @@
+-- Lets submit_form answer retried submissions with the original response
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key VARCHAR(64) PRIMARY KEY,
+    status_code SMALLINT NOT NULL,
+    response JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_idempotency_created (created_at)
+);
@@ -0,0 +1,3 @@
+-- The identifier pre-check syncs its in-memory sets from rows changed since the last sync
+ALTER TABLE vle_details
+    ADD KEY idx_vle_updated_at (updated_at);
@@ -0,0 +1,79 @@
+-- Materialized VLE counters per division/district/block/GP so dashboards stop
+-- grouping vle_details; the app keeps them current from here on.
+CREATE TABLE IF NOT EXISTS geo_counters (
+    level ENUM('gp', 'block', 'district', 'division') NOT NULL,
+    node_id INT NOT NULL,
+    individual_vles INT NOT NULL DEFAULT 0,
+    cluster_vles INT NOT NULL DEFAULT 0,
+    gps_covered INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (level, node_id)
+);
+
+CREATE TABLE IF NOT EXISTS geo_daily_enrollments (
+    level ENUM('gp', 'block', 'district', 'division') NOT NULL,
+    node_id INT NOT NULL,
+    day DATE NOT NULL,
+    enrollments INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (level, node_id, day)
+);
+
+-- Initial fill; run `flask rebuild-counters` instead if the app is already taking writes
+INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered)
+SELECT 'gp', a.lgd_code,
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'individual' THEN v.id END),
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'cluster' THEN v.id END),
+       COUNT(DISTINCT a.lgd_code)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.lgd_code;
+
+INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered)
+SELECT 'block', a.block_id,
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'individual' THEN v.id END),
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'cluster' THEN v.id END),
+       COUNT(DISTINCT a.lgd_code)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.block_id;
+
+INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered)
+SELECT 'district', a.district_id,
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'individual' THEN v.id END),
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'cluster' THEN v.id END),
+       COUNT(DISTINCT a.lgd_code)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.district_id;
+
+INSERT INTO geo_counters (level, node_id, individual_vles, cluster_vles, gps_covered)
+SELECT 'division', a.division_id,
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'individual' THEN v.id END),
+       COUNT(DISTINCT CASE WHEN v.vle_type = 'cluster' THEN v.id END),
+       COUNT(DISTINCT a.lgd_code)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.division_id;
+
+INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments)
+SELECT 'gp', a.lgd_code, DATE(v.created_at), COUNT(DISTINCT v.id)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.lgd_code, DATE(v.created_at);
+
+INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments)
+SELECT 'block', a.block_id, DATE(v.created_at), COUNT(DISTINCT v.id)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.block_id, DATE(v.created_at);
+
+INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments)
+SELECT 'district', a.district_id, DATE(v.created_at), COUNT(DISTINCT v.id)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.district_id, DATE(v.created_at);
+
+INSERT INTO geo_daily_enrollments (level, node_id, day, enrollments)
+SELECT 'division', a.division_id, DATE(v.created_at), COUNT(DISTINCT v.id)
+FROM vle_grampanchayats a
+JOIN vle_details v ON v.id = a.vle_id
+GROUP BY a.division_id, DATE(v.created_at);
@@ -0,0 +1,3 @@
+-- Sent confirmation emails no longer keep their payload (it held unmasked
+-- Aadhar, PAN and account numbers); new messages are queued masked.
+UPDATE email_outbox SET payload = JSON_OBJECT() WHERE status = 'sent';
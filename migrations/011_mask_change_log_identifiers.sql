@@ -0,0 +1,27 @@
+-- vle_change_log no longer keeps Aadhar, PAN and account numbers in clear;
+-- mask the old and new values already logged the way update_record now
+-- does. Masked values mask to themselves, so this is safe to run again.
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.aadhar_number[0]',
+    IF(CHAR_LENGTH(changes->>'$.aadhar_number[0]') >= 4, CONCAT('**** **** ', RIGHT(changes->>'$.aadhar_number[0]', 4)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.aadhar_number[0]') = 'STRING' AND changes->>'$.aadhar_number[0]' NOT IN ('', 'Not provided');
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.aadhar_number[1]',
+    IF(CHAR_LENGTH(changes->>'$.aadhar_number[1]') >= 4, CONCAT('**** **** ', RIGHT(changes->>'$.aadhar_number[1]', 4)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.aadhar_number[1]') = 'STRING' AND changes->>'$.aadhar_number[1]' NOT IN ('', 'Not provided');
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.pan_number[0]',
+    IF(CHAR_LENGTH(changes->>'$.pan_number[0]') >= 4, CONCAT(LEFT(changes->>'$.pan_number[0]', 2), '*****', RIGHT(changes->>'$.pan_number[0]', 2)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.pan_number[0]') = 'STRING' AND changes->>'$.pan_number[0]' NOT IN ('', 'Not provided');
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.pan_number[1]',
+    IF(CHAR_LENGTH(changes->>'$.pan_number[1]') >= 4, CONCAT(LEFT(changes->>'$.pan_number[1]', 2), '*****', RIGHT(changes->>'$.pan_number[1]', 2)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.pan_number[1]') = 'STRING' AND changes->>'$.pan_number[1]' NOT IN ('', 'Not provided');
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.account_number[0]',
+    IF(CHAR_LENGTH(changes->>'$.account_number[0]') >= 4, CONCAT('****', RIGHT(changes->>'$.account_number[0]', 4)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.account_number[0]') = 'STRING' AND changes->>'$.account_number[0]' NOT IN ('', 'Not provided');
+UPDATE vle_change_log
+SET changes = JSON_SET(changes, '$.account_number[1]',
+    IF(CHAR_LENGTH(changes->>'$.account_number[1]') >= 4, CONCAT('****', RIGHT(changes->>'$.account_number[1]', 4)), 'Not provided'))
+WHERE JSON_TYPE(changes->'$.account_number[1]') = 'STRING' AND changes->>'$.account_number[1]' NOT IN ('', 'Not provided');
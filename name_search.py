@@ -0,0 +1,117 @@
+import re
+import threading
+from array import array
+
+from vle_sync import VleSync
+
+
+# In-memory trigram index over VLE names and phone/CSC digits for the admin
+# search. Postings are append-only arrays of vle ids; a record that changes
+# only gains postings for its new trigrams, and stale ones are filtered out
+# when candidates are re-scored against the record's current text.
+COLUMNS = ('id', 'csc_id', 'vle_type', 'first_name', 'father_name', 'surname',
+           'contact_number', 'district', 'block')
+MIN_SCORE = 0.5          # share of the query's trigrams a result must contain
+
+_postings = {}
+_docs = {}               # vle id -> (normalized text, result row)
+_lock = threading.Lock()
+_stats = {'searches': 0, 'candidates': 0}
+
+
+def normalize(text):
+    return re.sub(r'[^0-9a-z]+', ' ', (text or '').casefold()).strip()
+
+
+def trigrams(text):
+    return {word[i:i + 3] for word in text.split() for i in range(len(word) - 2)}
+
+
+def _document_text(row):
+    return normalize(' '.join(str(row.get(column) or '') for column in (
+        'first_name', 'father_name', 'surname', 'contact_number', 'csc_id')))
+
+
+def _index(row):
+    """Add or refresh one record; caller holds _lock"""
+    vle_id = row['id']
+    text = _document_text(row)
+    old = _docs.get(vle_id)
+    new_grams = trigrams(text) - (trigrams(old[0]) if old else set())
+    for gram in new_grams:
+        postings = _postings.get(gram)
+        if postings is None:
+            postings = _postings[gram] = array('I')
+        postings.append(vle_id)
+    _docs[vle_id] = (text, {column: row.get(column) for column in COLUMNS})
+
+
+def _apply(rows):
+    with _lock:
+        for row in rows:
+            _index(row)
+
+
+# Picks up rows written by other processes, at most every NAME_SEARCH_SYNC_SECONDS
+_sync = VleSync('name search index', COLUMNS, _apply, 'NAME_SEARCH_SYNC_SECONDS', 10, dictionary=True)
+
+
+def load():
+    """Index every vle_details row (startup warm-up)"""
+    _sync.load()
+
+
+def upsert(vle_id, record):
+    """Index a just-committed vle_details row (dict keyed by column)"""
+    with _lock:
+        _index({**record, 'id': vle_id})
+
+
+def search(query, limit=20):
+    """Ranked records whose names or digits contain most of the query's trigrams.
+
+    Only the rarest trigrams are used to collect candidates (a record with at
+    least MIN_SCORE of the query's trigrams must contain one of them), then
+    each candidate is scored exactly against its current text. A record that
+    contains the whole query as a substring ranks above fuzzy matches.
+    """
+    _sync.sync()
+
+    text = normalize(query)
+    grams = trigrams(text)
+    if not grams:
+        return []
+    required = max(1, int(len(grams) * MIN_SCORE + 0.999))
+
+    with _lock:
+        by_rarity = sorted(grams, key=lambda gram: len(_postings.get(gram, ())))
+        candidates = set()
+        for gram in by_rarity[:len(grams) - required + 1]:
+            candidates.update(_postings.get(gram, ()))
+
+        scored = []
+        for vle_id in candidates:
+            doc_text, row = _docs[vle_id]
+            hits = sum(1 for gram in grams if gram in doc_text)
+            if hits < required:
+                continue
+            score = hits / len(grams)
+            if text in doc_text:
+                score += 1.0
+            scored.append((-score, vle_id, row))
+        _stats['searches'] += 1
+        _stats['candidates'] += len(candidates)
+
+    scored.sort(key=lambda item: (item[0], item[1]))
+    return [{**row, 'score': round(-negative_score, 3)} for negative_score, _, row in scored[:limit]]
+
+
+def stats():
+    with _lock:
+        return {
+            **_stats,
+            'records': len(_docs),
+            'trigrams': len(_postings),
+            'postings': sum(len(postings) for postings in _postings.values()),
+            **_sync.stats(),
+        }
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from db import get_db_connection
+
+log = logging.getLogger(__name__)
+
+
+# Delivery is retried with exponential backoff; after OUTBOX_MAX_ATTEMPTS a
+# message is dead-lettered (status 'dead') and kept for inspection. A sent
+# message keeps its row for stats, but its payload is cleared.
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 30))
+BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 3600))
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 2))
+LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 300))
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers = []
+_workers_pid = None
+_start_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'sent': 0,
+    'failed_attempts': 0,
+    'dead_lettered': 0,
+    'send_time_total': 0.0,
+    'send_time_max': 0.0,
+    'last_send_time': None,
+}
+_depth_cache = {'checked_at': 0.0, 'value': None}
+
+
+def enqueue(cursor, recipient, payload):
+    """Queue an email inside the caller's transaction; it is sent only if that transaction commits"""
+    cursor.execute(
+        "INSERT INTO email_outbox (recipient, payload) VALUES (%s, %s)",
+        (recipient, json.dumps(payload, default=str)))
+
+
+def wake():
+    """Nudge this process's workers to poll now instead of waiting for the next interval"""
+    _wakeup.set()
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _claim(limit):
+    """Lease up to `limit` due messages so no other worker or process picks them up"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, recipient, payload, attempts
+            FROM email_outbox
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+               OR (status = 'sending' AND locked_until < NOW())
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        rows = cursor.fetchall()
+        if rows:
+            placeholders = ','.join(['%s'] * len(rows))
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'sending', "
+                f"locked_until = NOW() + INTERVAL %s SECOND WHERE id IN ({placeholders})",
+                [LEASE_SECONDS] + [row['id'] for row in rows])
+        connection.commit()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
+
+
+def _finish(message_id, attempts, error=None):
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        if error is None:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'sent', attempts = %s, sent_at = NOW(), "
+                "locked_until = NULL, last_error = NULL, payload = JSON_OBJECT() WHERE id = %s",
+                (attempts, message_id))
+        elif attempts >= MAX_ATTEMPTS:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'dead', attempts = %s, "
+                "locked_until = NULL, last_error = %s WHERE id = %s",
+                (attempts, error[:2000], message_id))
+        else:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'pending', attempts = %s, "
+                "next_attempt_at = NOW() + INTERVAL %s SECOND, "
+                "locked_until = NULL, last_error = %s WHERE id = %s",
+                (attempts, int(backoff_seconds(attempts)), error[:2000], message_id))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def process_batch(send, limit=BATCH_SIZE):
+    """Claim and deliver one batch; returns the number of messages handled"""
+    rows = _claim(limit)
+    for row in rows:
+        attempts = row['attempts'] + 1
+        payload = row['payload']
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode('utf-8')
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+
+        started = time.monotonic()
+        try:
+            send(row['recipient'], payload)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.monotonic() - started
+
+        with _stats_lock:
+            if error is None:
+                _stats['sent'] += 1
+                _stats['send_time_total'] += elapsed
+                _stats['send_time_max'] = max(_stats['send_time_max'], elapsed)
+                _stats['last_send_time'] = elapsed
+            else:
+                _stats['failed_attempts'] += 1
+                if attempts >= MAX_ATTEMPTS:
+                    _stats['dead_lettered'] += 1
+
+        if error is not None:
+            log.warning("Error sending outbox message", extra={'fields': {
+                'message_id': row['id'], 'attempt': attempts, 'error': error}})
+        _finish(row['id'], attempts, error)
+    return len(rows)
+
+
+def _worker_loop(send):
+    while not _stop.is_set():
+        try:
+            handled = process_batch(send)
+        except Exception:
+            log.exception("Error in outbox worker")
+            handled = 0
+        if handled < BATCH_SIZE:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+
+
+def start_workers(send, count=None):
+    """Start the background delivery threads for this process (no-op if already running).
+
+    Tracks the pid so a forked child starts its own threads instead of
+    assuming the parent's are alive.
+    """
+    global _workers, _workers_pid
+    if count is None:
+        count = int(os.getenv('OUTBOX_WORKERS', 2))
+    if count <= 0 or _workers_pid == os.getpid():
+        return
+    with _start_lock:
+        if _workers_pid == os.getpid():
+            return
+        _stop.clear()
+        _workers = [
+            threading.Thread(target=_worker_loop, args=(send,), name=f'outbox-{i}', daemon=True)
+            for i in range(count)
+        ]
+        for worker in _workers:
+            worker.start()
+        _workers_pid = os.getpid()
+
+
+def stop_workers(timeout=5):
+    global _workers_pid
+    _stop.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers_pid = None
+
+
+def run_forever(send):
+    """Drain the outbox in the foreground (used by `flask drain-outbox`)"""
+    _worker_loop(send)
+
+
+def queue_depth(max_age=5.0):
+    """Counts per status, cached for a few seconds so frequent stats polling stays cheap"""
+    now = time.monotonic()
+    if _depth_cache['value'] is None or now - _depth_cache['checked_at'] > max_age:
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT status, COUNT(*) FROM email_outbox "
+                "WHERE status IN ('pending', 'sending', 'dead') GROUP BY status")
+            _depth_cache['value'] = {status: count for status, count in cursor.fetchall()}
+            cursor.close()
+        finally:
+            connection.close()
+        _depth_cache['checked_at'] = now
+    return _depth_cache['value']
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['send_time_avg'] = result['send_time_total'] / result['sent'] if result['sent'] else 0.0
+    result['workers'] = len(_workers) if _workers_pid == os.getpid() else 0
+    try:
+        result['queue'] = queue_depth()
+    except Exception as e:
+        result['queue'] = {'error': str(e)}
+    return result
@@ -0,0 +1,186 @@
+"""JSON logging for the app: request ids, per-route sampling, PII redaction, off-thread I/O.
+
+Request threads only put records on a bounded in-memory queue; a listener
+thread (one per process, restarted after fork) redacts, formats and writes
+them to stdout. When the queue is full, records are dropped and counted
+instead of blocking a request.
+
+Settings: LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SLOW_MS, and LOG_SAMPLE_RATES as
+"route=rate,..." overriding DEFAULT_SAMPLE_RATES (rate 0..1, per Flask
+endpoint; LOG_SAMPLE_RATES="default=0.1" changes every other route).
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+
+
+# Access-log share kept per route; the geography cascade and polling routes are noisy
+DEFAULT_SAMPLE_RATES = {
+    'default': 1.0,
+    'get_divisions': 0.01,
+    'get_districts': 0.01,
+    'get_blocks': 0.01,
+    'get_grampanchayats': 0.01,
+    'geography_bundle': 0.01,
+    'search_grampanchayats': 0.01,
+    'check_identifier': 0.05,
+    'metrics': 0.0,
+    'static': 0.0,
+}
+
+# Fields masked wherever they appear in structured log data (form and column names)
+PII_KEYS = {
+    'aadhar_number', 'aadharNumber', 'pan_number', 'panNumber',
+    'account_number', 'accountNumber',
+}
+PAN_PATTERN = re.compile(r'\b[A-Z]{5}\d{4}[A-Z]\b')
+# Aadhar (12 digits, optionally grouped) and account numbers (9-18 digits) in free text.
+# CSC IDs (8 digits + "00" + 2 digits) are left readable.
+LONG_NUMBER_PATTERN = re.compile(r'(?<![\d])(?:\d{4}[ -]\d{4}[ -]\d{4}|\d{9,18})(?![\d])')
+CSC_ID_PATTERN = re.compile(r'\d{8}00\d{2}')
+
+_context = threading.local()
+_listener = {'pid': None, 'listener': None}
+_listener_lock = threading.Lock()
+_dropped = {'count': 0}
+
+
+def _mask_number(match):
+    text = match.group(0)
+    if CSC_ID_PATTERN.fullmatch(text):
+        return text
+    digits = re.sub(r'\D', '', text)
+    return '*' * (len(digits) - 4) + digits[-4:]
+
+
+def redact_text(text):
+    text = PAN_PATTERN.sub(lambda m: m.group(0)[:2] + '*****' + m.group(0)[-2:], text)
+    return LONG_NUMBER_PATTERN.sub(_mask_number, text)
+
+
+def redact(value, key=None):
+    """Copy of `value` with PII fields masked and PII-looking numbers hidden in strings"""
+    if key in PII_KEYS and value:
+        text = str(value)
+        return '*' * max(0, len(text) - 4) + text[-4:]
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact_text(record.getMessage()),
+        }
+        for name in ('request_id', 'route'):
+            value = getattr(record, name, None)
+            if value:
+                entry[name] = value
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry['exc'] = redact_text(''.join(traceback.format_exception(*record.exc_info)))
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def prepare(self, record):
+        # Capture the request context on the calling thread; formatting happens on the listener
+        record.request_id = getattr(_context, 'request_id', None)
+        record.route = getattr(_context, 'route', None)
+        return record
+
+    def enqueue(self, record):
+        _ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped['count'] += 1
+
+
+_queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+
+
+def _ensure_listener():
+    """Start this process's writer thread (again after a fork, which doesn't copy threads)"""
+    if _listener['pid'] == os.getpid():
+        return
+    with _listener_lock:
+        if _listener['pid'] == os.getpid():
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(_queue, stream, respect_handler_level=False)
+        listener.start()
+        _listener.update(pid=os.getpid(), listener=listener)
+
+
+def configure():
+    """Route the root logger through the queue; safe to call more than once"""
+    root = logging.getLogger()
+    if any(isinstance(handler, NonBlockingQueueHandler) for handler in root.handlers):
+        return
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+
+def _sample_rates():
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in os.getenv('LOG_SAMPLE_RATES', '').split(','):
+        route, _, rate = item.partition('=')
+        if route.strip() and rate.strip():
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+_rates = _sample_rates()
+
+
+def set_request_context(request_id, route):
+    _context.request_id = request_id
+    _context.route = route
+
+
+def clear_request_context():
+    _context.request_id = None
+    _context.route = None
+
+
+def log_request(logger, method, route, status, duration_ms, **fields):
+    """Access-log line for a finished request, sampled per route.
+
+    Errors (status >= 400) and requests slower than LOG_SLOW_MS are always kept.
+    """
+    slow = duration_ms >= float(os.getenv('LOG_SLOW_MS', 1000))
+    if status < 400 and not slow:
+        rate = _rates.get(route, _rates['default'])
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+    level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 or slow else logging.INFO
+    logger.log(level, 'request', extra={'fields': {
+        'method': method, 'status': status, 'duration_ms': round(duration_ms, 1), **fields}})
+
+
+def stats():
+    return {'queued': _queue.qsize(), 'dropped': _dropped['count']}
@@ -0,0 +1,157 @@
+import re
+
+
+def validate_pincode(pincode):
+    """Validate that pincode is exactly 6 digits"""
+    return bool(pincode) and pincode.isdigit() and len(pincode) == 6
+
+
+def normalize_identifier(value):
+    """Strip spaces and dashes so CSC ID, Aadhar and mobile numbers are stored and searched in one form"""
+    return re.sub(r'[\s-]', '', value or '')
+
+
+def check_grampanchayat_count(vle_type, grampanchayat_ids):
+    """Error message when the number of selected GPs doesn't suit the VLE type, else None"""
+    if vle_type == 'cluster' and len(grampanchayat_ids) < 2:
+        return 'Please select at least 2 grampanchayats for cluster type'
+    if vle_type == 'individual' and len(grampanchayat_ids) != 1:
+        return 'Please select exactly 1 grampanchayat for individual type'
+    return None
+
+
+def check_cibil_score(cibil_score):
+    """Error message unless the CIBIL score is a whole number from 300 to 900, else None"""
+    cibil_score = str(cibil_score or '')
+    if not cibil_score.isdigit() or not (300 <= int(cibil_score) <= 900):
+        return 'Invalid CIBIL score (must be 300-900)'
+    return None
+
+
+# Declarative rule set for the enrollment form, shared by submit_form,
+# update_record and /validate_batch. Records use the form's field names.
+REQUIRED_FIELDS = [
+    'employeeType', 'division', 'district', 'block', 'cscId', 'firstName', 'fatherName',
+    'motherName', 'surname', 'dob', 'gender', 'maritalStatus', 'religion', 'category',
+    'education', 'instituteName', 'contactNumber', 'email', 'permAddressLine1', 'permCity',
+    'permPincode',
+]
+
+# Same patterns the form enforces in the browser, applied after normalize_identifier
+FIELD_PATTERNS = {
+    'cscId': (re.compile(r'\d{8}00\d{2}'), "CSC ID must be 12 digits with 9th and 10th digits as '00'"),
+    'contactNumber': (re.compile(r'\d{10}'), 'Contact number must be 10 digits'),
+    'email': (re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+'), 'Invalid email address'),
+}
+
+
+def _check_employee_type(record):
+    if record['employeeType'] not in ('individual', 'cluster'):
+        return "employeeType must be 'individual' or 'cluster'"
+    return None
+
+
+def _matches_pattern(field):
+    pattern, message = FIELD_PATTERNS[field]
+
+    def check(record):
+        value = record[field] if field == 'email' else normalize_identifier(record[field])
+        return None if pattern.fullmatch(value.strip()) else message
+    return check
+
+
+def _check_gp_count(record):
+    return check_grampanchayat_count(record['employeeType'], record['grampanchayat'])
+
+
+def _check_perm_pincode(record):
+    if not validate_pincode(record['permPincode']):
+        return 'Invalid permanent address pincode (must be 6 digits)'
+    return None
+
+
+def _check_curr_pincode(record):
+    if (not record.get('sameCurrentAddress') and record.get('currPincode')
+            and not validate_pincode(record['currPincode'])):
+        return 'Invalid current address pincode (must be 6 digits)'
+    return None
+
+
+def _check_cibil(record):
+    return check_cibil_score(record.get('cibilScore', ''))
+
+
+# (field reported, fields the rule needs, check) in the order submit_form reports them
+RULES = [
+    ('employeeType', ('employeeType',), _check_employee_type),
+    ('grampanchayat', ('employeeType',), _check_gp_count),
+    ('permPincode', ('permPincode',), _check_perm_pincode),
+    ('currPincode', (), _check_curr_pincode),
+    ('cibilScore', (), _check_cibil),
+] + [(field, (field,), _matches_pattern(field)) for field in FIELD_PATTERNS]
+
+
+def record_from_form(form):
+    """Plain dict of a submitted form with 'grampanchayat' as a list of ids"""
+    record = {key: form.get(key) for key in form}
+    if form.get('employeeType') == 'cluster':
+        record['grampanchayat'] = form.getlist('grampanchayat')
+    else:
+        gp = form.get('grampanchayat')
+        record['grampanchayat'] = [gp] if gp else []
+    return record
+
+
+def record_from_json(item):
+    """Same shape as record_from_form for one JSON object (values may be numbers, GPs a list)"""
+    record = {key: '' if value is None else str(value)
+              for key, value in item.items() if not isinstance(value, (list, dict))}
+    gps = item.get('grampanchayat')
+    if isinstance(gps, list):
+        record['grampanchayat'] = [str(gp).strip() for gp in gps if str(gp).strip()]
+    else:
+        record['grampanchayat'] = [gp.strip() for gp in str(gps or '').split(',') if gp.strip()]
+    return record
+
+
+def check_rules(record, missing=(), first_only=False):
+    """Errors from RULES alone, skipping rules that need a field listed in `missing`"""
+    errors = []
+    for field, needs, check in RULES:
+        if any(name in missing for name in needs):
+            continue
+        message = check(record)
+        if message:
+            errors.append({'field': field, 'message': message})
+            if first_only:
+                break
+    return errors
+
+
+def validate_record(record, snapshot, first_only=False):
+    """Run the form rules and resolve the geography selection against `snapshot`.
+
+    Returns (errors, location): errors is a list of {'field', 'message'}
+    (empty when valid) and location is resolve_selection()'s result, or None
+    when the selection couldn't be checked. With first_only=True it stops at
+    the first error, as the form routes only report one.
+    """
+    errors = []
+    missing = [field for field in REQUIRED_FIELDS if not (record.get(field) or '').strip()]
+    if missing:
+        errors.append({'field': missing[0], 'message': f"Missing required field(s): {', '.join(missing)}"})
+        if first_only:
+            return errors, None
+
+    rule_errors = check_rules(record, missing, first_only)
+    errors.extend(rule_errors)
+    if rule_errors and first_only:
+        return errors, None
+
+    location = None
+    if not any(name in missing for name in ('division', 'district', 'block')):
+        location = snapshot.resolve_selection(
+            record['division'], record['district'], record['block'], record['grampanchayat'])
+        if not location['ok']:
+            errors.append({'field': 'grampanchayat', 'message': location['message']})
+    return errors, location
@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+
+from db import get_db_connection
+from email_render import mask_aadhar, mask_pan, mask_account
+from vle_import import COLUMNS
+
+
+EXPORT_COLUMNS = ['id'] + COLUMNS + ['created_at']
+
+# Filters accepted by the export endpoint and CLI, mapped to their WHERE clause
+FILTERS = {
+    'division': 'division = %s',
+    'district': 'district = %s',
+    'block': 'block = %s',
+    'vle_type': 'vle_type = %s',
+    'created_from': 'created_at >= %s',
+    'created_to': 'created_at < %s',
+}
+
+MASKS = {
+    'aadhar_number': mask_aadhar,
+    'pan_number': mask_pan,
+    'account_number': mask_account,
+}
+
+FETCH_SIZE = 1000
+
+
+def _query(filters):
+    clauses, params = [], []
+    for name, value in filters.items():
+        if value and name in FILTERS:
+            clauses.append(FILTERS[name])
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    # Exempt from DB_READ_TIMEOUT (db.py): the statement stays open while the response streams
+    return f"SELECT /*+ MAX_EXECUTION_TIME(0) */ {', '.join(EXPORT_COLUMNS)} FROM vle_details {where} ORDER BY id", params
+
+
+def iter_rows(filters, mask=False):
+    """Yield export rows as tuples, FETCH_SIZE at a time from an unbuffered cursor.
+
+    Only one fetch chunk is in memory at a time, however large the table is.
+    The connection is held until the generator is exhausted or closed.
+    """
+    query, params = _query(filters)
+    mask_at = [(EXPORT_COLUMNS.index(column), fn) for column, fn in MASKS.items()] if mask else []
+    connection = get_db_connection()
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                if mask_at:
+                    row = list(row)
+                    for index, fn in mask_at:
+                        row[index] = fn(row[index])
+                yield row
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        # An abandoned unbuffered result leaves the connection unusable; the pool discards it
+        connection.close()
+
+
+def iter_csv(filters, mask=False):
+    """CSV text chunks: the header, then one chunk per FETCH_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(iter_rows(filters, mask), 1):
+        writer.writerow(row)
+        if i % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(filters, mask=False):
+    """JSON Lines chunks, one object per record"""
+    lines = []
+    for row in iter_rows(filters, mask):
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, ensure_ascii=False))
+        if len(lines) >= FETCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
@@ -0,0 +1,279 @@
+import csv
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import mysql.connector
+
+import geo_cache
+from assignments import write_assignments_bulk
+from db import get_db_connection
+from validation import check_rules, normalize_identifier
+
+
+# vle_details columns taken from the CSV (abcd.csv layout); id is assigned by MySQL
+COLUMNS = [
+    'vle_type', 'csc_id', 'division', 'district', 'block', 'grampanchayat', 'lgd_code',
+    'first_name', 'father_name', 'mother_name', 'surname', 'dob', 'blood_group', 'gender',
+    'marital_status', 'spouse_name', 'num_children', 'anniversary_date', 'religion',
+    'category', 'caste', 'education', 'institute_name', 'contact_number', 'whatsapp_number',
+    'email', 'permanent_address', 'current_address', 'pan_number', 'aadhar_number',
+    'bank_name', 'ifsc_code', 'account_number', 'branch_name', 'cibil_score',
+]
+
+REQUIRED = [
+    'csc_id', 'vle_type', 'lgd_code', 'first_name', 'father_name', 'mother_name', 'surname',
+    'dob', 'gender', 'marital_status', 'religion', 'category', 'education', 'institute_name',
+    'contact_number', 'email', 'permanent_address',
+]
+
+# VARCHAR sizes from MH_WEB_APP_Database_creation.sql; one over-long value would fail the whole batch
+COLUMN_LENGTHS = {
+    'csc_id': 12, 'division': 100, 'district': 100, 'block': 100, 'grampanchayat': 100,
+    'first_name': 50, 'father_name': 50, 'mother_name': 50, 'surname': 50, 'blood_group': 3,
+    'gender': 10, 'marital_status': 15, 'spouse_name': 50, 'religion': 20, 'category': 20,
+    'caste': 50, 'education': 20, 'institute_name': 100, 'contact_number': 10,
+    'whatsapp_number': 10, 'email': 100, 'pan_number': 10, 'aadhar_number': 12,
+    'bank_name': 50, 'ifsc_code': 11, 'account_number': 20, 'branch_name': 50,
+}
+
+# Re-importing a csc_id updates the record (and its row_version, so open edits go stale);
+# created_at is kept from the first import.
+# The VALUES list must be plain placeholders for executemany() to send one multi-row INSERT.
+UPSERT_QUERY = """
+    INSERT INTO vle_details (%s, created_at)
+    VALUES (%s)
+    ON DUPLICATE KEY UPDATE %s
+""" % (
+    ', '.join(COLUMNS),
+    ', '.join(['%s'] * (len(COLUMNS) + 1)),
+    ', '.join([f"{column} = VALUES({column})" for column in COLUMNS if column != 'csc_id']
+              + ['row_version = row_version + 1']),
+)
+
+# Addresses are stored as "line1, line2, City - 411016" by submit_form
+PINCODE_AT_END = re.compile(r'-\s*(\S+)\s*$')
+
+
+def _check_date(row, column, date_format='%Y-%m-%d', example='YYYY-MM-DD'):
+    if row.get(column):
+        try:
+            datetime.strptime(row[column], date_format)
+        except ValueError:
+            raise ValueError(f"{column} '{row[column]}' is not a valid date ({example})")
+
+
+def _pincode(address):
+    match = PINCODE_AT_END.search(address or '')
+    return match.group(1) if match else ''
+
+
+def form_record(row, lgd_codes):
+    """The CSV row under the form's field names, for validation.check_rules"""
+    return {
+        'employeeType': row['vle_type'],
+        'grampanchayat': lgd_codes,
+        'permPincode': _pincode(row['permanent_address']),
+        'sameCurrentAddress': (not row.get('current_address')
+                               or row['current_address'] == row['permanent_address']),
+        'currPincode': _pincode(row.get('current_address')),
+        'cibilScore': row.get('cibil_score', ''),
+        'cscId': row['csc_id'],
+        'contactNumber': row['contact_number'],
+        'email': row['email'],
+    }
+
+
+def build_record(row, snapshot):
+    """Validate one CSV row with submit_form's rules (validation.RULES).
+
+    Returns (record, lgd_codes, created_at) or raises ValueError with the
+    same message submit_form would have answered with.
+    """
+    row = {key: (value or '').strip() for key, value in row.items() if key}
+
+    missing = [column for column in REQUIRED if not row.get(column)]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+
+    lgd_codes = [code.strip() for code in row['lgd_code'].split(',') if code.strip()]
+    errors = check_rules(form_record(row, lgd_codes), first_only=True)
+    if errors:
+        raise ValueError(errors[0]['message'])
+
+    _check_date(row, 'dob')
+    _check_date(row, 'anniversary_date')
+    _check_date(row, 'created_at', '%Y-%m-%d %H:%M:%S', 'YYYY-MM-DD HH:MM:SS')
+    if row.get('num_children') and not row['num_children'].isdigit():
+        raise ValueError('num_children must be a whole number')
+
+    # Geography comes from the LGD codes; any names in the file must agree with them
+    ancestors = snapshot.ancestors_of_gp(int(lgd_codes[0])) if lgd_codes[0].isdigit() else None
+    if ancestors is None:
+        raise ValueError('One or more selected grampanchayats not found')
+    block_id, district_id, division_id = ancestors
+    location = snapshot.resolve_selection(division_id, district_id, block_id, lgd_codes)
+    if not location['ok']:
+        raise ValueError(location['message'])
+    for column in ('division', 'district', 'block'):
+        if row.get(column) and row[column].casefold() != location[column].casefold():
+            raise ValueError(f"{column} '{row[column]}' does not match LGD code(s) ({location[column]})")
+
+    record = {column: row.get(column, '') for column in COLUMNS}
+    record.update({
+        'division': location['division'],
+        'district': location['district'],
+        'block': location['block'],
+        'grampanchayat': ', '.join(location['grampanchayat_names']),
+        'lgd_code': ', '.join(location['lgd_codes']),
+        'csc_id': normalize_identifier(row['csc_id']),
+        'contact_number': normalize_identifier(row['contact_number']),
+        'whatsapp_number': normalize_identifier(row.get('whatsapp_number')),
+        'aadhar_number': normalize_identifier(row.get('aadhar_number')),
+        'num_children': int(row['num_children']) if row.get('num_children') else None,
+        'anniversary_date': row.get('anniversary_date') or None,
+        'current_address': row.get('current_address') or None,
+        'cibil_score': int(row['cibil_score']),
+    })
+    for column, length in COLUMN_LENGTHS.items():
+        if record[column] and len(record[column]) > length:
+            raise ValueError(f"{column} is longer than {length} characters")
+    created_at = row.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return record, location['lgd_codes'], created_at
+
+
+def _write_batch(connection, batch, snapshot):
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(
+            UPSERT_QUERY,
+            [[record[column] for column in COLUMNS] + [created_at] for record, _, created_at, _ in batch])
+        csc_ids = [record['csc_id'] for record, _, _, _ in batch]
+        cursor.execute(
+            "SELECT csc_id, id FROM vle_details WHERE csc_id IN (%s)" % ','.join(['%s'] * len(csc_ids)),
+            csc_ids)
+        ids = dict(cursor.fetchall())
+        write_assignments_bulk(
+            cursor, {ids[record['csc_id']]: codes for record, codes, _, _ in batch}, snapshot)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def run_import(csv_path, batch_size=500, rejects_path=None, resume=False, echo=print):
+    """Stream a CSV into vle_details in batched upserts, one transaction per batch.
+
+    Rows failing validation, or rejected by MySQL when their batch is retried
+    row by row, go to `rejects_path` (original columns plus an `error`
+    column). Progress is checkpointed to `<csv>.checkpoint` after each
+    committed batch; with resume=True already committed rows are skipped.
+    Because writes are upserts keyed on csc_id, replaying a batch is harmless.
+    """
+    rejects_path = rejects_path or csv_path + '.rejects.csv'
+    checkpoint_path = csv_path + '.checkpoint'
+    state = (_read_checkpoint(checkpoint_path) if resume else None) or {
+        'rows_done': 0, 'imported': 0, 'rejected': 0, 'rejects_offset': 0}
+    skip = state['rows_done']
+    resuming = bool(skip)
+
+    snapshot = geo_cache.get()
+    connection = get_db_connection()
+    started = time.monotonic()
+    processed = 0
+    try:
+        with open(csv_path, newline='', encoding='utf-8-sig') as source, \
+                open(rejects_path, 'a+' if resuming else 'w', newline='', encoding='utf-8') as rejects_file:
+            reader = csv.DictReader(source)
+            rejects = csv.DictWriter(rejects_file, fieldnames=list(reader.fieldnames or []) + ['error'],
+                                     extrasaction='ignore')
+            if resuming and rejects_file.seek(0, os.SEEK_END) >= state['rejects_offset'] > 0:
+                # Drop rejects written after the last checkpoint; those rows are read again
+                rejects_file.seek(state['rejects_offset'])
+                rejects_file.truncate()
+            else:
+                if resuming and state['rejected']:
+                    echo(f"{rejects_path} is missing or shorter than at the last checkpoint; "
+                         f"starting it again, the {state['rejected']} earlier rejects are not in it")
+                rejects_file.truncate(0)
+                rejects.writeheader()
+
+            batch = []
+            pending_rejected = 0
+            row_number = 0
+
+            def flush():
+                nonlocal pending_rejected
+                imported = len(batch)
+                if batch:
+                    try:
+                        _write_batch(connection, batch, snapshot)
+                    except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+                        raise
+                    except mysql.connector.Error:
+                        # A row the checks above let through failed the multi-row upsert;
+                        # write the batch row by row so only the failing rows are rejected
+                        imported = 0
+                        for item in batch:
+                            try:
+                                _write_batch(connection, [item], snapshot)
+                                imported += 1
+                            except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+                                raise
+                            except mysql.connector.Error as e:
+                                pending_rejected += 1
+                                rejects.writerow({**item[3], 'error': f"Database error: {e.msg}"})
+                rejects_file.flush()
+                state['rows_done'] = row_number
+                state['imported'] += imported
+                state['rejected'] += pending_rejected
+                state['rejects_offset'] = rejects_file.tell()
+                _write_checkpoint(checkpoint_path, state)
+                batch.clear()
+                pending_rejected = 0
+                elapsed = time.monotonic() - started
+                echo(f"{row_number} rows ({state['imported']} imported, {state['rejected']} rejected), "
+                     f"{processed / elapsed if elapsed else 0:.0f} rows/sec")
+
+            for row in reader:
+                row_number += 1
+                if row_number <= skip:
+                    continue
+                processed += 1
+                try:
+                    record, codes, created_at = build_record(row, snapshot)
+                except ValueError as e:
+                    pending_rejected += 1
+                    rejects.writerow({**row, 'error': str(e)})
+                    continue
+                batch.append((record, codes, created_at, row))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+    finally:
+        connection.close()
+
+    elapsed = time.monotonic() - started
+    os.remove(checkpoint_path)
+    echo(f"Done: {state['imported']} imported, {state['rejected']} rejected "
+         f"({rejects_path}) in {elapsed:.1f}s, {processed / elapsed if elapsed else 0:.0f} rows/sec")
+    return state
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+import time
+
+from db import get_db_connection
+
+log = logging.getLogger(__name__)
+
+
+# Rows whose updated_at is this close to the last sync are read again, so a
+# transaction that committed late with an older timestamp is not missed
+SYNC_OVERLAP_SECONDS = 60
+FETCH_SIZE = 5000
+
+
+class VleSync:
+    """Feeds an in-memory copy of vle_details the rows other processes saved.
+
+    `apply(rows)` gets each batch of `columns` plus updated_at (tuples, or
+    dicts with `dictionary=True`). load() reads the whole table; sync() then
+    reads only rows with a newer updated_at, at most every `interval_env`
+    seconds. With `backfill=False` there is no load() and the first sync
+    starts SYNC_OVERLAP_SECONDS before the database's NOW(), for caches that
+    start empty.
+    """
+
+    def __init__(self, label, columns, apply, interval_env, default_interval, dictionary=False, backfill=True):
+        self.label = label
+        self.columns = tuple(columns)
+        self.apply = apply
+        self.interval_env = interval_env
+        self.default_interval = default_interval
+        self.dictionary = dictionary
+        self.backfill = backfill
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._state = {'loaded': False, 'synced_through': None, 'last_sync': 0.0}
+        self._stats = {'syncs': 0}
+
+    def _read_rows(self, where='', params=()):
+        """Pass the matching rows to apply(); returns the newest updated_at seen"""
+        newest = None
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor(dictionary=self.dictionary)
+            # Full-table warm-up reads must outlive DB_READ_TIMEOUT (db.py)
+            cursor.execute(
+                f"SELECT /*+ MAX_EXECUTION_TIME(0) */ {', '.join(self.columns)}, updated_at "
+                f"FROM vle_details {where}", params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                self.apply(rows)
+                for row in rows:
+                    updated_at = row['updated_at'] if self.dictionary else row[-1]
+                    if updated_at is not None and (newest is None or updated_at > newest):
+                        newest = updated_at
+            cursor.close()
+        finally:
+            connection.close()
+        return newest
+
+    def load(self):
+        """Read every vle_details row (startup warm-up)"""
+        newest = self._read_rows()
+        with self._lock:
+            self._state.update(loaded=True, synced_through=newest, last_sync=time.monotonic())
+
+    def sync(self):
+        """load() on first use, then pick up rows saved since the last sync"""
+        if self.backfill and not self._state['loaded']:
+            with self._load_lock:
+                if not self._state['loaded']:
+                    self.load()
+            return
+        interval = float(os.getenv(self.interval_env, self.default_interval))
+        with self._lock:
+            if time.monotonic() - self._state['last_sync'] < interval:
+                return
+            self._state['last_sync'] = time.monotonic()
+            since = self._state['synced_through']
+        try:
+            if since is not None:
+                newest = self._read_rows(
+                    "WHERE updated_at >= %s - INTERVAL %s SECOND", (since, SYNC_OVERLAP_SECONDS))
+            elif self.backfill:
+                newest = self._read_rows()
+            else:
+                newest = self._read_rows(
+                    "WHERE updated_at >= NOW() - INTERVAL %s SECOND", (SYNC_OVERLAP_SECONDS,))
+            with self._lock:
+                if newest is not None and (self._state['synced_through'] is None
+                                           or newest > self._state['synced_through']):
+                    self._state['synced_through'] = newest
+                self._stats['syncs'] += 1
+        except Exception:
+            # Keep answering from what is in memory; the next check retries
+            log.exception("Error syncing %s", self.label)
+
+    def stats(self):
+        with self._lock:
+            synced_through = self._state['synced_through']
+            return {**self._stats, 'synced_through': str(synced_through) if synced_through else None}